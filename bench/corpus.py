@@ -0,0 +1,288 @@
+import json
+from pathlib import Path
+
+# Builders for the compact json ast of solc, so the corpus can be
+# regenerated without a compiler: python -m bench.corpus
+
+def ident(name):
+  return {'nodeType': 'Identifier', 'name': name}
+
+def literal(value, kind='number'):
+  return {'nodeType': 'Literal', 'kind': kind, 'value': str(value)}
+
+def true():
+  return literal('true', 'bool')
+
+def elementary(name):
+  return {'nodeType': 'ElementaryTypeName', 'name': name}
+
+def user_defined(name):
+  return {'nodeType': 'UserDefinedTypeName', 'typeDescriptions': {'typeString': name}}
+
+def mapping(key_type, value_type):
+  return {'nodeType': 'Mapping', 'keyType': key_type, 'valueType': value_type}
+
+def var(name, type_name):
+  return {'nodeType': 'VariableDeclaration', 'name': name, 'typeName': type_name}
+
+def binary(left, operator, right):
+  return {'nodeType': 'BinaryOperation', 'leftExpression': left, 'rightExpression': right, 'operator': operator}
+
+def unary(sub, operator, prefix=True):
+  return {'nodeType': 'UnaryOperation', 'subExpression': sub, 'prefix': prefix, 'operator': operator}
+
+def call(function, *arguments):
+  return {'nodeType': 'FunctionCall', 'kind': 'functionCall', 'expression': function, 'arguments': list(arguments)}
+
+def member(expression, name):
+  return {'nodeType': 'MemberAccess', 'memberName': name, 'expression': expression}
+
+def index(base, key):
+  return {'nodeType': 'IndexAccess', 'baseExpression': base, 'indexExpression': key}
+
+def assign(left, right, operator='='):
+  return {'nodeType': 'Assignment', 'leftHandSide': left, 'rightHandSide': right, 'operator': operator}
+
+def statement(expression):
+  return {'nodeType': 'ExpressionStatement', 'expression': expression}
+
+def builtin(name, *arguments):
+  return statement(call(ident(name), *arguments))
+
+def block(*statements):
+  return {'nodeType': 'Block', 'statements': list(statements)}
+
+def if_statement(condition, true_body, false_body=None):
+  return {'nodeType': 'IfStatement', 'condition': condition, 'trueBody': true_body, 'falseBody': false_body}
+
+def return_statement(expression=None):
+  return {'nodeType': 'Return', 'expression': expression}
+
+def declare(declarations, initial_value=None):
+  return {'nodeType': 'VariableDeclarationStatement', 'declarations': declarations, 'initialValue': initial_value}
+
+def for_statement(init, condition, loop, body):
+  return {'nodeType': 'ForStatement', 'initializationExpression': init, 'condition': condition, 'loopExpression': loop, 'body': body}
+
+def function(name, parameters, returns, body, visibility='public'):
+  return {
+    'nodeType': 'FunctionDefinition',
+    'name': name,
+    'parameters': {'parameters': parameters},
+    'returnParameters': {'parameters': returns},
+    'body': body,
+    'visibility': visibility,
+    'modifiers': [],
+  }
+
+def contract(name, nodes, bases=(), kind='contract'):
+  return {
+    'nodeType': 'ContractDefinition',
+    'contractKind': kind,
+    'name': name,
+    'baseContracts': [{'nodeType': 'InheritanceSpecifier', 'baseName': user_defined(f'contract {x}')} for x in bases],
+    'nodes': nodes,
+  }
+
+def source_unit(*contracts):
+  return {'nodeType': 'SourceUnit', 'nodes': [{'nodeType': 'PragmaDirective'}] + list(contracts)}
+
+UINT = elementary('uint256')
+ADDRESS = elementary('address')
+BOOL = elementary('bool')
+SENDER = member(ident('msg'), 'sender')
+
+def sum_of(name):
+  return call(ident('sum_uint'), ident(name))
+
+def old(expression):
+  return call(ident('old_uint'), expression)
+
+def safe_math():
+  return contract('SafeMath', [
+    function('add', [var('a', UINT), var('b', UINT)], [var('c', UINT)], block(
+      builtin('ensures', true(), binary(ident('c'), '>=', ident('a'))),
+      statement(assign(ident('c'), binary(ident('a'), '+', ident('b')))),
+    ), 'internal'),
+    function('sub', [var('a', UINT), var('b', UINT)], [var('c', UINT)], block(
+      builtin('ensures', binary(ident('b'), '<=', ident('a')), binary(ident('c'), '<=', ident('a'))),
+      builtin('require', binary(ident('b'), '<=', ident('a'))),
+      statement(assign(ident('c'), binary(ident('a'), '-', ident('b')))),
+    ), 'internal'),
+  ], kind='library')
+
+def erc20(name, checked):
+  balance = lambda x: index(ident('balances'), x)
+  allowance = lambda x, y: index(index(ident('allowed'), x), y)
+  # Moves value between two balances, plain or through SafeMath
+  def move(source, target, value):
+    if checked:
+      return [
+        statement(assign(balance(source), call(member(balance(source), 'sub'), value))),
+        statement(assign(balance(target), call(member(balance(target), 'add'), value))),
+      ]
+    return [
+      statement(assign(balance(source), value, '-=')),
+      statement(assign(balance(target), value, '+=')),
+    ]
+  conserved = binary(sum_of('balances'), '==', old(sum_of('balances')))
+  nodes = [
+    var('balances', mapping(ADDRESS, UINT)),
+    var('allowed', mapping(ADDRESS, mapping(ADDRESS, UINT))),
+    var('supply', UINT),
+    function('transfer', [var('to', ADDRESS), var('value', UINT)], [var('success', BOOL)], block(
+      builtin('ensures', binary(ident('to'), '!=', SENDER), conserved),
+      builtin('require', binary(balance(SENDER), '>=', ident('value'))),
+      *move(SENDER, ident('to'), ident('value')),
+      builtin('assert', binary(balance(ident('to')), '>=', ident('value'))),
+      return_statement(true()),
+    )),
+    function('transferFrom', [var('source', ADDRESS), var('to', ADDRESS), var('value', UINT)], [var('success', BOOL)], block(
+      builtin('ensures', binary(ident('to'), '!=', ident('source')), conserved),
+      builtin('require', binary(balance(ident('source')), '>=', ident('value'))),
+      builtin('require', binary(allowance(ident('source'), SENDER), '>=', ident('value'))),
+      statement(assign(allowance(ident('source'), SENDER), ident('value'), '-=')),
+      *move(ident('source'), ident('to'), ident('value')),
+      return_statement(true()),
+    )),
+    function('approve', [var('spender', ADDRESS), var('value', UINT)], [var('success', BOOL)], block(
+      statement(assign(allowance(SENDER, ident('spender')), ident('value'))),
+      builtin('assert', binary(allowance(SENDER, ident('spender')), '==', ident('value'))),
+      return_statement(true()),
+    )),
+    function('mint', [var('to', ADDRESS), var('value', UINT)], [], block(
+      builtin('ensures', true(), binary(sum_of('balances'), '==', binary(old(sum_of('balances')), '+', ident('value')))),
+      statement(assign(balance(ident('to')), ident('value'), '+=')),
+      statement(assign(ident('supply'), ident('value'), '+=')),
+    )),
+  ]
+  if checked:
+    nodes.insert(0, {'nodeType': 'UsingForDirective', 'typeName': UINT, 'libraryName': user_defined('library SafeMath')})
+  return contract(name, nodes)
+
+def loops():
+  counter = lambda bound, body: for_statement(
+    declare([var('i', UINT)], literal(0)),
+    binary(ident('i'), '<', bound),
+    statement(unary(ident('i'), '++', False)),
+    body
+  )
+  return contract('Loops', [
+    function('small', [var('n', UINT)], [var('s', UINT)], block(
+      counter(literal(3), block(statement(assign(ident('s'), ident('i'), '+=')))),
+      builtin('assert', binary(ident('s'), '>=', literal(0))),
+    )),
+    function('wide', [], [var('s', UINT)], block(
+      counter(literal(8), block(statement(assign(ident('s'), literal(1), '+=')))),
+      builtin('assert', binary(ident('s'), '==', literal(8))),
+    )),
+    function('nested', [var('n', UINT)], [var('s', UINT)], block(
+      counter(literal(3), block(
+        if_statement(binary(ident('n'), '>', ident('i')), block(statement(assign(ident('s'), literal(1), '+=')))),
+      )),
+      builtin('assert', binary(ident('s'), '<=', literal(3))),
+    )),
+    function('invariant', [var('n', UINT)], [var('s', UINT)], block(
+      counter(ident('n'), block(
+        builtin('invariant', binary(ident('s'), '==', ident('i'))),
+        statement(assign(ident('s'), literal(1), '+=')),
+      )),
+      builtin('assert', binary(ident('s'), '>=', literal(0))),
+    )),
+  ])
+
+def inheritance(depth):
+  contracts = []
+  for level in range(depth):
+    name = f'Level{level}'
+    bases = [f'Level{level - 1}'] if level else []
+    contracts.append(contract(name, [
+      var(f'value{level}', UINT),
+      function(f'set{level}', [var('x', UINT)], [], block(
+        statement(assign(ident(f'value{level}'), ident('x'))),
+        builtin('assert', binary(ident(f'value{level}'), '==', ident('x'))),
+      )),
+      function(f'bump{level}', [], [], block(
+        builtin('require', binary(ident(f'value{level}'), '<', literal(1000))),
+        statement(assign(ident(f'value{level}'), literal(1), '+=')),
+        builtin('assert', binary(ident(f'value{level}'), '>', literal(0))),
+      )),
+    ], bases))
+  return contracts
+
+def structs():
+  info = user_defined('struct Registry.Info')
+  point = user_defined('struct Registry.Point')
+  return contract('Registry', [
+    {'nodeType': 'StructDefinition', 'name': 'Point', 'members': [var('x', UINT), var('y', UINT)]},
+    {'nodeType': 'StructDefinition', 'name': 'Info', 'members': [var('owner', ADDRESS), var('origin', point), var('amount', UINT)]},
+    var('info', info),
+    var('infos', mapping(ADDRESS, info)),
+    var('points', mapping(UINT, point)),
+    function('origin', [], [var('r', UINT)], block(
+      statement(assign(ident('r'), binary(member(member(ident('info'), 'origin'), 'x'), '+', member(member(ident('info'), 'origin'), 'y')))),
+      builtin('assert', binary(ident('r'), '>=', member(member(ident('info'), 'origin'), 'x'))),
+    )),
+    function('owned', [var('who', ADDRESS)], [], block(
+      builtin('require', binary(member(index(ident('infos'), ident('who')), 'owner'), '==', SENDER)),
+      builtin('assert', binary(member(index(ident('infos'), ident('who')), 'amount'), '>=', literal(0))),
+      builtin('assert', binary(member(index(ident('infos'), ident('who')), 'owner'), '==', SENDER)),
+    )),
+    function('distance', [var('a', UINT), var('b', UINT)], [var('d', UINT)], block(
+      if_statement(
+        binary(member(index(ident('points'), ident('a')), 'x'), '>', member(index(ident('points'), ident('b')), 'x')),
+        block(statement(assign(ident('d'), binary(member(index(ident('points'), ident('a')), 'x'), '-', member(index(ident('points'), ident('b')), 'x'))))),
+        block(statement(assign(ident('d'), binary(member(index(ident('points'), ident('b')), 'x'), '-', member(index(ident('points'), ident('a')), 'x'))))),
+      ),
+      builtin('assert', binary(ident('d'), '>=', literal(0))),
+    )),
+  ])
+
+def calls(depth):
+  # step0 calls step1 ... calls step{depth - 1}, each summarized by ensures
+  nodes = []
+  for level in range(depth):
+    if level == depth - 1:
+      body = statement(assign(ident('y'), binary(ident('x'), '+', literal(1))))
+    else:
+      body = statement(assign(ident('y'), binary(call(ident(f'step{level + 1}'), ident('x')), '+', literal(1))))
+    nodes.append(function(f'step{level}', [var('x', UINT)], [var('y', UINT)], block(
+      builtin('ensures', true(), binary(ident('y'), '>', ident('x'))),
+      body,
+    ), 'internal'))
+  nodes.append(function('entry', [var('x', UINT)], [], block(
+    declare([var('r', UINT)], call(ident('step0'), ident('x'))),
+    builtin('assert', binary(ident('r'), '>', ident('x'))),
+  )))
+  return contract('Calls', nodes)
+
+def sequential_ifs(count):
+  # count independent ifs, 2 ** count feasible paths
+  parameters = [var(f'a{x}', UINT) for x in range(count)]
+  statements = []
+  for x in range(count):
+    statements.append(if_statement(
+      binary(ident(f'a{x}'), '>', literal(x)),
+      block(statement(assign(ident('s'), literal(1), '+='))),
+    ))
+  statements.append(builtin('assert', binary(ident('s'), '<=', literal(count))))
+  return contract(f'Ifs{count}', [
+    function('run', parameters, [var('s', UINT)], block(*statements)),
+  ])
+
+corpus = {
+  'erc20': lambda: source_unit(erc20('Token', False)),
+  'erc20_safemath': lambda: source_unit(safe_math(), erc20('SafeToken', True)),
+  'loops': lambda: source_unit(loops()),
+  'inheritance': lambda: source_unit(*inheritance(6)),
+  'structs': lambda: source_unit(structs()),
+  'calls': lambda: source_unit(calls(6)),
+  'ifs_4': lambda: source_unit(sequential_ifs(4)),
+  'ifs_8': lambda: source_unit(sequential_ifs(8)),
+}
+
+if __name__ == '__main__':
+  directory = Path(__file__).parent / 'corpus'
+  directory.mkdir(exist_ok=True)
+  for name, build in corpus.items():
+    (directory / f'{name}.json').write_text(json.dumps(build(), indent=1) + '\n')
@@ -0,0 +1,101 @@
+import sys
+import json
+import resource
+from time import perf_counter
+from pathlib import Path
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from zero import *
+
+# Runs every contract of the corpus in a fresh process and compares the
+# numbers against bench/baselines.json: python -m bench.run [--update]
+
+root = Path(__file__).parent
+timings = ['parse', 'solve', 'total']
+
+def measure(path):
+  with open(path) as fp:
+    start = perf_counter()
+    ast = parse_stream(fp)
+    parse = perf_counter() - start
+  # Paths of the execution tree, before infeasible branches are pruned
+  paths = 0
+  for contract, contracts, libraries, variables, functions in generate_contracts(ast):
+    for idx, func in enumerate(functions):
+      if is_verified_function(func) and idx in contracts[contract.name].verified:
+        paths += sum(1 for x in compute_execution_paths(func.body))
+  start = perf_counter()
+  results = validate(ast, writers=[])
+  total = perf_counter() - start
+  # Profiling has an overhead of its own, so it only runs second
+  profile = Profiler()
+  validate(ast, writers=[], profile=profile)
+  solve = sum([elapsed for key, (elapsed, count) in profile.times.items() if key[-1] == 'solve'])
+  return {
+    'parse': parse,
+    'paths': paths,
+    'feasible': len(profile.paths),
+    'checks': len(results),
+    'proved': len([x for x in results if x.status == 'proved']),
+    'solve': solve,
+    'total': total,
+    'memory': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+  }
+
+def run(path, repeat):
+  # Best of repeat runs, every run in a process of its own so the peak
+  # memory and the sort cache start fresh
+  best = None
+  for x in range(repeat):
+    with Pool(1) as pool:
+      data = pool.apply(measure, (path,))
+    if best is None:
+      best = data
+    for name in timings + ['memory']:
+      best[name] = min(best[name], data[name])
+  return best
+
+def compare(name, data, baseline, tolerance):
+  # Counts have to match exactly, times and memory may vary by tolerance
+  problems = []
+  for key, value in data.items():
+    if key not in baseline: continue
+    expected = baseline[key]
+    if key in timings:
+      # Timer noise on very short runs is not a regression
+      if value > expected * (1 + tolerance) and value - expected > 0.1:
+        problems.append(f'{key} {expected:.3f}s -> {value:.3f}s')
+    elif key == 'memory':
+      if value > expected * (1 + tolerance):
+        problems.append(f'{key} {expected}KB -> {value}KB')
+    elif value != expected:
+      problems.append(f'{key} {expected} -> {value}')
+  return problems
+
+if __name__ == '__main__':
+  parser = ArgumentParser()
+  parser.add_argument('names', nargs='*', help='corpus entries, all by default')
+  parser.add_argument('--repeat', type=int, default=3, help='runs per entry, the best one counts')
+  parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+  parser.add_argument('--update', action='store_true', help='store the numbers as the new baselines')
+  args = parser.parse_args()
+  baselines_path = root / 'baselines.json'
+  baselines = json.loads(baselines_path.read_text()) if baselines_path.exists() else {}
+  names = args.names or sorted([x.stem for x in (root / 'corpus').glob('*.json')])
+  failed = False
+  print(f'{"name":16} {"parse":>8} {"paths":>6} {"feasible":>8} {"checks":>6} {"solve":>8} {"total":>8} {"memory":>9}')
+  for name in names:
+    data = run(root / 'corpus' / f'{name}.json', args.repeat)
+    print(
+      f'{name:16} {data["parse"]:8.3f} {data["paths"]:6d} {data["feasible"]:8d} {data["checks"]:6d} '
+      f'{data["solve"]:8.3f} {data["total"]:8.3f} {data["memory"]:7d}KB'
+    )
+    problems = compare(name, data, baselines.get(name, {}), args.tolerance)
+    for problem in problems:
+      print(f'  regression: {problem}')
+    failed = failed or bool(problems)
+    if args.update:
+      baselines[name] = data
+  if args.update:
+    baselines_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+  sys.exit(1 if failed and not args.update else 0)
@@ -1,8 +1,127 @@
-import json
+import io
+import os
+import sys
+import time
+import subprocess
+from contextlib import nullcontext, ExitStack
 from zero import *
-from pathlib import Path
+from argparse import ArgumentParser
+
+def load(path):
+    if path == '-':
+        return parse_stream(sys.stdin)
+    if path.endswith('.sol'):
+        # Compiled on the fly, the same way as make compile
+        output = subprocess.run(
+            ['solc', '--ast-compact-json', path],
+            capture_output=True, text=True, check=True
+        ).stdout
+        return parse_stream(io.StringIO(output))
+    with open(path) as fp:
+        return parse_stream(fp)
+
+def run(args, options, cache, queries):
+    profile = Profiler() if args.profile is not None else None
+    with profile.phase('parse') if profile else nullcontext():
+        root = load(args.input)
+    # Files are closed after every run, watch mode opens them again
+    with ExitStack() as files:
+        writers = [ConsoleWriter(args.trace)]
+        if args.jsonl:
+            writers.append(JSONLinesWriter(files.enter_context(open(args.jsonl, 'w'))))
+        if args.sarif:
+            writers.append(SarifWriter(files.enter_context(open(args.sarif, 'w'))))
+        validate(root, args.jobs, cache, options, writers, queries, profile)
+    if queries:
+        queries.save()
+        print(f'query cache: {queries.hits} hits, {queries.misses} misses')
+    if profile:
+        profile.write_report(sys.stdout)
+        if args.profile:
+            with open(args.profile, 'w') as fp:
+                profile.write_folded(fp)
+
+def watch(args, options, cache, queries):
+    # Runs again whenever the input changes, functions whose digest did not
+    # change are taken from the cache instead of being verified. With one
+    # job the sorts and prologues of the verifier stay warm as well, worker
+    # processes are started again for every run
+    cache = cache or MemoryCache()
+    modified, seen = None, None
+    try:
+        while True:
+            try:
+                current = os.stat(args.input).st_mtime_ns
+            except FileNotFoundError:
+                current = None
+            # Only once the file stopped changing, make compile writes it
+            # in several steps
+            if current is not None and current == seen and current != modified:
+                modified = current
+                hits, misses = cache.hits, cache.misses
+                start = time.perf_counter()
+                try:
+                    run(args, options, cache, queries)
+                    print(
+                        f'{cache.misses - misses} functions verified, {cache.hits - hits} reused '
+                        f'in {time.perf_counter() - start:.2f}s, watching {args.input}'
+                    )
+                except Exception as e:
+                    # Keep watching, the next save may fix it
+                    print(getattr(e, 'stderr', None) or repr(e), file=sys.stderr)
+            seen = current
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
-    root = Path('./contracts/DEF.json').read_text()
-    root = parse(json.loads(root))
-    validate(root)
\ No newline at end of file
+    parser = ArgumentParser()
+    parser.add_argument('input', nargs='?', default='./contracts/DEF.json', help='compact json ast or solidity source, - for stdin')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--cache', help='directory of cached verification results')
+    parser.add_argument('--query-cache', nargs='?', const='', help='memoize solver queries, kept in this file if given')
+    parser.add_argument('--profile', nargs='?', const='', help='print where time goes, write a flamegraph trace to this file if given')
+    parser.add_argument('--unroll', type=int, help='maximum number of unrolled loop iterations')
+    parser.add_argument('--induction', action='store_true', help='summarize loops with their invariants')
+    parser.add_argument('--merge', action='store_true', help='join the states of both branches of an if')
+    parser.add_argument('--timeout', type=int, help='milliseconds per solver query')
+    parser.add_argument('--rlimit', type=int, help='resource limit per solver query')
+    parser.add_argument('--function-timeout', type=float, help='seconds for all solver queries of a function')
+    parser.add_argument('--function-rlimit', type=int, help='resource limit for all solver queries of a function')
+    parser.add_argument('--retry', action='store_true', help='retry unknown queries with other tactics')
+    parser.add_argument('--bitvector', action='store_true', help='encode uintN and address as bit vectors')
+    parser.add_argument('--wrapping', action='store_true', help='let bit vector arithmetic wrap around instead of reverting')
+    parser.add_argument('--slice', action='store_true', help='drop constraints unrelated to the checked condition')
+    parser.add_argument('--quantifier-free', action='store_true', help='constrain mapping values only where they are used')
+    parser.add_argument('--max-paths', type=int, help='stop verifying a function after this many paths')
+    parser.add_argument('--max-depth', type=int, help='drop paths with more branch decisions than this')
+    parser.add_argument('--watch', action='store_true', help='verify again whenever the input file changes')
+    parser.add_argument('--interval', type=float, default=0.2, help='seconds between checks of the input in watch mode')
+    parser.add_argument('--trace', action='store_true', help='print the concrete trace of a failed assertion')
+    parser.add_argument('--jsonl', help='write one json result per line to this file')
+    parser.add_argument('--sarif', help='write a sarif log to this file')
+    args = parser.parse_args()
+    if args.watch and args.input == '-':
+        parser.error('--watch needs an input file')
+    cache = VerificationCache(args.cache) if args.cache else None
+    queries = QueryCache(path=args.query_cache) if args.query_cache is not None else None
+    options = Options(
+        args.unroll,
+        args.induction,
+        args.merge,
+        query_timeout=args.timeout,
+        query_rlimit=args.rlimit,
+        function_timeout=args.function_timeout,
+        function_rlimit=args.function_rlimit,
+        retry=args.retry,
+        bitvector=args.bitvector,
+        wrapping=args.wrapping,
+        slice_queries=args.slice,
+        quantifier_free=args.quantifier_free,
+        max_paths=args.max_paths,
+        max_depth=args.max_depth
+    )
+    if args.watch:
+        watch(args, options, cache, queries)
+    else:
+        run(args, options, cache, queries)
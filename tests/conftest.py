@@ -0,0 +1,11 @@
+import pytest
+from zero import *
+
+# Trees are built with the builders of bench/corpus.py, so the tests run
+# without a compiler: python -m pytest
+
+@pytest.fixture
+def verify():
+  def run(unit, jobs=1, cache=None, queries=None, writers=None, **options):
+    return validate(parse(unit), jobs, cache, Options(**options), writers or [], queries)
+  return run
@@ -0,0 +1,26 @@
+import pytest
+from bench.corpus import *
+
+modes = [{'bitvector': True}, {'bitvector': True, 'wrapping': True}]
+
+@pytest.mark.parametrize('options', modes)
+def test_literal_wider_than_operand(verify, options):
+  unit = source_unit(contract('Narrow', [
+    function('f', [var('x', elementary('uint8'))], [], block(
+      builtin('assert', binary(ident('x'), '<', literal(300))),
+      builtin('assert', binary(ident('x'), '<', literal(255))),
+    )),
+  ]))
+  results = verify(unit, **options)
+  assert [x.status for x in results] == ['proved', 'falsified']
+  assert results[1].model['x'] == 255
+
+@pytest.mark.parametrize('options', [{}] + modes)
+def test_literal_arithmetic_keeps_full_width(verify, options):
+  unit = source_unit(contract('Literals', [
+    function('f', [], [], block(
+      builtin('assert', binary(binary(literal(3), '+', literal(1)), '==', literal(5))),
+      builtin('assert', binary(binary(literal(3), '+', literal(1)), '==', literal(4))),
+    )),
+  ]))
+  assert [x.status for x in verify(unit, **options)] == ['falsified', 'proved']
@@ -0,0 +1,49 @@
+from bench.corpus import *
+from zero import *
+
+def counter(name):
+  return contract(name, [
+    var('total', UINT),
+    function('inc', [var('x', UINT)], [], block(
+      statement(assign(ident('total'), binary(ident('total'), '+', ident('x')))),
+      builtin('assert', binary(ident('total'), '>=', ident('x'))),
+    )),
+  ])
+
+def test_equal_contracts_keep_their_own_results(verify, tmp_path):
+  unit = source_unit(counter('A'), counter('B'))
+  first = verify(unit, cache=VerificationCache(tmp_path))
+  cache = VerificationCache(tmp_path)
+  second = verify(unit, cache=cache)
+  assert cache.hits == 2
+  assert [x.contract for x in first] == ['A', 'B']
+  assert [x.contract for x in second] == ['A', 'B']
+
+def test_memory_cache_of_watch_mode(verify):
+  unit = source_unit(counter('A'), counter('B'))
+  cache = MemoryCache()
+  verify(unit, cache=cache)
+  assert [x.contract for x in verify(unit, cache=cache)] == ['A', 'B']
+  assert cache.hits == 2
+
+def branches(name):
+  return contract(name, [
+    function('f', [var('x', UINT)], [], block(
+      if_statement(binary(ident('x'), '>', literal(1)), block(
+        builtin('assert', binary(ident('x'), '>', literal(0))),
+      )),
+    )),
+  ])
+
+def test_bounded_results_are_cached(verify):
+  cache = MemoryCache()
+  first = verify(source_unit(branches('A')), cache=cache, max_paths=1)
+  second = verify(source_unit(branches('A')), cache=cache, max_paths=1)
+  assert [x.status for x in first] == ['proved', 'unknown']
+  assert cache.hits == 1 and first == second
+
+def test_time_limited_unknowns_are_not_cached(verify):
+  cache = MemoryCache()
+  results = verify(source_unit(branches('A')), cache=cache, function_timeout=1e-9)
+  assert [x.kind for x in results] == ['timeout']
+  assert not cache.entries
@@ -0,0 +1,8 @@
+from bench.corpus import *
+
+def test_models_do_not_depend_on_workers(verify):
+  unit = source_unit(safe_math(), erc20('SafeToken', True))
+  single = verify(unit)
+  pooled = verify(unit, jobs=2)
+  assert [x.model for x in single if x.model]
+  assert [(x.status, x.model, x.trace) for x in single] == [(x.status, x.model, x.trace) for x in pooled]
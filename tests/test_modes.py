@@ -0,0 +1,56 @@
+import pytest
+from bench.corpus import *
+from zero import *
+
+modes = [
+  {'slice_queries': True},
+  {'bitvector': True},
+  {'merge_paths': True},
+  {'quantifier_free': True},
+  {'slice_queries': True, 'merge_paths': True, 'quantifier_free': True},
+]
+
+def statuses(results):
+  # Merged paths report an assertion once, so the worst status of every
+  # assertion is compared
+  rank = {'proved': 0, 'unknown': 1, 'falsified': 2}
+  found = {}
+  for x in results:
+    key = x.contract, x.function, x.kind, x.assertion
+    found[key] = max(found.get(key, 'proved'), x.status, key=rank.get)
+  return found
+
+@pytest.mark.parametrize('name', corpus)
+@pytest.mark.parametrize('mode', modes, ids=lambda x: '+'.join(x))
+def test_modes_agree_with_default(verify, name, mode):
+  default = statuses(verify(corpus[name]()))
+  assert statuses(verify(corpus[name](), **mode)) == default
+
+def unreachable():
+  # The sliced query of ok drops the requires, which contradict each other
+  return contract('Dead', [
+    function('f', [var('a', UINT), var('x', UINT)], [], block(
+      builtin('require', binary(ident('a'), '>', literal(5))),
+      builtin('require', binary(ident('a'), '<', literal(3))),
+      builtin('ok', binary(ident('x'), '>', literal(0))),
+    )),
+  ])
+
+def test_slice_confirms_reachability(verify):
+  for mode in [{}, {'slice_queries': True}]:
+    assert [x.status for x in verify(source_unit(unreachable()), **mode)] == ['falsified']
+
+@pytest.mark.parametrize('name', ['erc20', 'erc20_safemath', 'ifs_4'])
+def test_query_cache_answers_every_query(verify, name):
+  queries = QueryCache()
+  first = verify(corpus[name](), queries=queries)
+  misses = queries.misses
+  second = verify(corpus[name](), queries=queries)
+  assert queries.misses == misses
+  assert queries.hits > 0
+  assert statuses(second) == statuses(first)
+
+def test_max_paths_cuts_off_the_exploration(verify):
+  results = verify(corpus['ifs_4'](), max_paths=3)
+  assert [(x.path, x.kind) for x in results] == [(0, 'assert'), (1, 'assert'), (2, 'assert'), (3, 'bound')]
+  assert results[-1].assertion == 'max_paths=3'
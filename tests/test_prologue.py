@@ -0,0 +1,21 @@
+from bench.corpus import *
+
+def test_functions_share_interface_typed_state(verify):
+  # f reads c as an ICounter, g afterwards as a plain address
+  unit = source_unit(
+    contract('ICounter', [
+      function('count', [], [var('n', UINT)], None, 'external'),
+    ], kind='interface'),
+    contract('User', [
+      var('c', ADDRESS),
+      function('f', [], [], block(
+        declare([var('n', UINT)], call(member(call(ident('ICounter'), ident('c')), 'count'))),
+        builtin('assert', binary(ident('n'), '>=', literal(0))),
+      )),
+      function('g', [], [], block(
+        builtin('assert', binary(member(ident('c'), 'balance'), '>=', literal(0))),
+      )),
+    ]),
+  )
+  results = verify(unit)
+  assert [(x.function, x.status) for x in results] == [('f', 'proved'), ('g', 'proved')]
@@ -0,0 +1,27 @@
+import io
+import json
+from bench.corpus import *
+from zero import *
+
+def test_sarif_levels(verify):
+  # Proved, falsified and unknown results, the last one from max_paths
+  unit = source_unit(contract('Checks', [
+    function('f', [var('x', UINT)], [], block(
+      builtin('assert', binary(ident('x'), '>=', literal(0))),
+      if_statement(binary(ident('x'), '>', literal(1)), block(
+        builtin('assert', binary(ident('x'), '>', literal(2))),
+      ), block(
+        builtin('assert', binary(ident('x'), '>', literal(0))),
+      )),
+    )),
+  ]))
+  fp = io.StringIO()
+  verify(unit, writers=[SarifWriter(fp)], max_paths=1)
+  log = json.loads(fp.getvalue())
+  results = log['runs'][0]['results']
+  assert [x['level'] for x in results] == ['none', 'error', 'warning']
+  rules = [x['id'] for x in log['runs'][0]['tool']['driver']['rules']]
+  for result in results:
+    # SARIF 2.1.0: level has to be none unless kind is fail
+    assert result['kind'] == 'fail' or result['level'] == 'none'
+    assert result['ruleId'] in rules
@@ -1,65 +1,152 @@
 from typing import List, Any, Optional
 from dataclasses import dataclass
-
-@dataclass
-class ElementaryTypeName:
+from weakref import WeakValueDictionary
+
+class Node:
+  # AST nodes are frozen, so the structural hash is computed only once and
+  # identical subtrees can be shared through intern_node
+  __slots__ = ('_hash', '__weakref__')
+
+  def __post_init__(self):
+    for name in self.__slots__:
+      value = getattr(self, name)
+      if isinstance(value, list):
+        object.__setattr__(self, name, tuple(value))
+
+  def __hash__(self):
+    try:
+      return self._hash
+    except AttributeError:
+      value = hash((type(self),) + tuple([getattr(self, x) for x in self.__slots__]))
+      object.__setattr__(self, '_hash', value)
+      return value
+
+  def __eq__(self, other):
+    if self is other: return True
+    if type(self) is not type(other): return False
+    if hash(self) != hash(other): return False
+    return all([getattr(self, x) == getattr(other, x) for x in self.__slots__])
+
+  def __reduce__(self):
+    return type(self), tuple([getattr(self, x) for x in self.__slots__])
+
+def walk_nodes(node):
+  if isinstance(node, Node):
+    yield node
+    for name in node.__slots__:
+      yield from walk_nodes(getattr(node, name))
+  elif isinstance(node, (list, tuple)):
+    for x in node:
+      yield from walk_nodes(x)
+
+interned = WeakValueDictionary()
+
+def intern_node(node):
+  return interned.setdefault(node, node)
+
+@dataclass(frozen=True, eq=False)
+class ElementaryTypeName(Node):
+  __slots__ = ('name',)
   name: str
 
-@dataclass
-class Mapping:
+@dataclass(frozen=True, eq=False)
+class Mapping(Node):
+  __slots__ = ('key_type', 'value_type')
   key_type: Any
   value_type: Any
 
-@dataclass
-class UserDefinedTypeName:
+@dataclass(frozen=True, eq=False)
+class UserDefinedTypeName(Node):
+  __slots__ = ('name',)
   name: str
 
-@dataclass
-class ArrayTypeName:
+@dataclass(frozen=True, eq=False)
+class ArrayTypeName(Node):
+  __slots__ = ('base_type', 'length')
   base_type: Any
   length: Optional[int]
 
-@dataclass
-class BinaryOperation:
+# Binding strength of the binary operators, => is the implication of
+# specifications. Unary operators bind stronger than all of them
+precedence = {
+  '=>': 1, '||': 2, '&&': 3, '==': 4, '!=': 4, '<': 5, '>': 5, '<=': 5, '>=': 5,
+  '|': 6, '^': 7, '&': 8, '<<': 9, '>>': 9, '+': 10, '-': 10, '*': 11, '/': 11, '%': 11, '**': 12,
+}
+
+def operand_repr(node, strength):
+  # Operands binding weaker than their operator are parenthesized
+  text = repr(node)
+  if isinstance(node, BinaryOperation) and precedence.get(node.operator, 0) < strength:
+    return f'({text})'
+  if isinstance(node, (Assignment, Conditional)):
+    return f'({text})'
+  return text
+
+@dataclass(frozen=True, eq=False)
+class BinaryOperation(Node):
+  __slots__ = ('left_expression', 'right_expression', 'operator')
   left_expression: Any
   right_expression: Any
   operator: str
 
   def __repr__(self):
-    left = repr(self.left_expression)
-    right = repr(self.right_expression)
+    strength = precedence.get(self.operator, 0)
+    # Operators of the same strength group from the left
+    left = operand_repr(self.left_expression, strength)
+    right = operand_repr(self.right_expression, strength + 1)
     return f'{left} {self.operator} {right}'
 
-@dataclass
-class UnaryOperation:
+@dataclass(frozen=True, eq=False)
+class UnaryOperation(Node):
+  __slots__ = ('sub_expression', 'prefix', 'operator')
   sub_expression: Any
   prefix: bool
   operator: str
 
-@dataclass
-class TupleExpression:
+  def __repr__(self):
+    sub = operand_repr(self.sub_expression, precedence['**'] + 1)
+    return f'{self.operator}{sub}' if self.prefix else f'{sub}{self.operator}'
+
+@dataclass(frozen=True, eq=False)
+class TupleExpression(Node):
+  __slots__ = ('components',)
   components: List[Any]
 
-@dataclass
-class Assignment:
+  def __repr__(self):
+    return '(' + ','.join([repr(x) for x in self.components]) + ')'
+
+@dataclass(frozen=True, eq=False)
+class Assignment(Node):
+  __slots__ = ('left_hand_side', 'right_hand_side', 'operator')
   left_hand_side: Any
   right_hand_side: Any
   operator: str
 
-@dataclass
-class Identifier:
+  def __repr__(self):
+    left = repr(self.left_hand_side)
+    right = repr(self.right_hand_side)
+    return f'{left} {self.operator} {right}'
+
+@dataclass(frozen=True, eq=False)
+class Identifier(Node):
+  __slots__ = ('name',)
   name: str
 
   def __repr__(self):
     return self.name
 
-@dataclass
-class Literal:
+@dataclass(frozen=True, eq=False)
+class Literal(Node):
+  __slots__ = ('kind', 'value')
   kind: str
   value: str
 
-@dataclass
-class FunctionCall:
+  def __repr__(self):
+    return self.value
+
+@dataclass(frozen=True, eq=False)
+class FunctionCall(Node):
+  __slots__ = ('kind', 'expression', 'arguments')
   kind: str
   expression: Any
   arguments: List[Any]
@@ -69,30 +156,41 @@ class FunctionCall:
     right = ','.join([repr(x) for x in self.arguments])
     return f'{left}({right})'
 
-@dataclass
-class IndexAccess:
+@dataclass(frozen=True, eq=False)
+class IndexAccess(Node):
+  __slots__ = ('index_expression', 'base_expression')
   index_expression: Any
   base_expression: Any
 
-@dataclass
-class MemberAccess:
+  def __repr__(self):
+    return f'{self.base_expression!r}[{self.index_expression!r}]'
+
+@dataclass(frozen=True, eq=False)
+class MemberAccess(Node):
+  __slots__ = ('member_name', 'expression')
   member_name: str
   expression: Any
 
-@dataclass
-class ElementaryTypeNameExpression:
+  def __repr__(self):
+    return f'{self.expression!r}.{self.member_name}'
+
+@dataclass(frozen=True, eq=False)
+class ElementaryTypeNameExpression(Node):
+  __slots__ = ('name',)
   name: str
 
-@dataclass
-class VariableDeclaration:
+@dataclass(frozen=True, eq=False)
+class VariableDeclaration(Node):
+  __slots__ = ('name', 'type_name')
   name: str
   type_name: Any
 
   def __repr__(self):
     return self.name
 
-@dataclass
-class FunctionDefinition:
+@dataclass(frozen=True, eq=False)
+class FunctionDefinition(Node):
+  __slots__ = ('name', 'parameters', 'returns', 'body', 'visibility', 'modifiers')
   name: str
   parameters: List[VariableDeclaration]
   returns: List[VariableDeclaration]
@@ -100,19 +198,22 @@ class FunctionDefinition:
   visibility: str
   modifiers: List[Any]
 
-@dataclass
-class Block:
+@dataclass(frozen=True, eq=False)
+class Block(Node):
+  __slots__ = ('statements',)
   statements: List[Any]
 
-@dataclass
-class ExpressionStatement:
+@dataclass(frozen=True, eq=False)
+class ExpressionStatement(Node):
+  __slots__ = ('expression',)
   expression: Any
 
   def __repr__(self):
     return repr(self.expression)
 
-@dataclass
-class VariableDeclarationStatement:
+@dataclass(frozen=True, eq=False)
+class VariableDeclarationStatement(Node):
+  __slots__ = ('declarations', 'initial_value')
   declarations: List[VariableDeclaration]
   initial_value: Optional[Any]
 
@@ -121,87 +222,115 @@ class VariableDeclarationStatement:
     right = repr(self.initial_value) if self.initial_value else None
     return f'{left} = {right}'
 
-@dataclass
-class ForStatement:
+@dataclass(frozen=True, eq=False)
+class ForStatement(Node):
+  __slots__ = ('init', 'condition', 'loop', 'body')
   init: Any
   condition: Any
   loop: Any
   body: Any
 
-@dataclass
-class IfStatement:
+@dataclass(frozen=True, eq=False)
+class IfStatement(Node):
+  __slots__ = ('condition', 'true_body', 'false_body')
   condition: Any
   true_body: Any
   false_body: Any
 
-@dataclass
-class Return:
+  def __repr__(self):
+    return f'if ({self.condition!r})'
+
+@dataclass(frozen=True, eq=False)
+class Return(Node):
+  __slots__ = ('expression',)
   expression: Optional[Any]
 
-@dataclass
-class PlaceholderStatement: pass
+  def __repr__(self):
+    return f'return {self.expression!r}' if self.expression else 'return'
+
+@dataclass(frozen=True, eq=False)
+class PlaceholderStatement(Node):
+  __slots__ = ()
 
-@dataclass
-class ContractDefinition:
+@dataclass(frozen=True, eq=False)
+class ContractDefinition(Node):
+  __slots__ = ('base_contracts', 'kind', 'name', 'nodes')
   base_contracts: List[Any]
   kind: str
   name: str
   nodes: List[Any]
 
-@dataclass
-class StructDefinition:
+@dataclass(frozen=True, eq=False)
+class StructDefinition(Node):
+  __slots__ = ('name', 'members')
   name: str
   members: List[VariableDeclaration]
 
-@dataclass
-class SourceUnit:
+@dataclass(frozen=True, eq=False)
+class SourceUnit(Node):
+  __slots__ = ('nodes',)
   nodes: List[Any]
 
-@dataclass
-class Nothing: pass
+@dataclass(frozen=True, eq=False)
+class Nothing(Node):
+  __slots__ = ()
 
-@dataclass
-class Anything:
+@dataclass(frozen=True, eq=False)
+class Anything(Node):
+  __slots__ = ('type_name',)
   type_name: Any
 
-@dataclass
-class UsingForDirective:
+  def __repr__(self):
+    return '*'
+
+@dataclass(frozen=True, eq=False)
+class UsingForDirective(Node):
+  __slots__ = ('type_name', 'library_name')
   type_name: Any
   library_name: Any
 
-@dataclass
-class InheritanceSpecifier:
+@dataclass(frozen=True, eq=False)
+class InheritanceSpecifier(Node):
+  __slots__ = ('base_name',)
   base_name: Any
 
-@dataclass
-class ModifierInvocation:
+@dataclass(frozen=True, eq=False)
+class ModifierInvocation(Node):
+  __slots__ = ('modifier_name', 'arguments')
   modifier_name: Any
   arguments: List[Any]
 
-@dataclass
-class EmitStatement: pass
+@dataclass(frozen=True, eq=False)
+class EmitStatement(Node):
+  __slots__ = ()
 
-@dataclass
-class EventDefinition:
+@dataclass(frozen=True, eq=False)
+class EventDefinition(Node):
+  __slots__ = ('name',)
   name: str
 
-@dataclass
-class ModifierDefinition:
+@dataclass(frozen=True, eq=False)
+class ModifierDefinition(Node):
+  __slots__ = ('body', 'parameters')
   body: Any
   parameters: List[Any]
 
-@dataclass
-class InlineAssembly: pass
+@dataclass(frozen=True, eq=False)
+class InlineAssembly(Node):
+  __slots__ = ()
 
-@dataclass
-class PragmaDirective: pass
+@dataclass(frozen=True, eq=False)
+class PragmaDirective(Node):
+  __slots__ = ()
 
-@dataclass
-class Conditional:
+@dataclass(frozen=True, eq=False)
+class Conditional(Node):
+  __slots__ = ('condition', 'true_expression', 'false_expression')
   condition: Any
   true_expression: Any
   false_expression: Any
 
-@dataclass
-class NewExpression:
-  type_name: Any
\ No newline at end of file
+@dataclass(frozen=True, eq=False)
+class NewExpression(Node):
+  __slots__ = ('type_name',)
+  type_name: Any
@@ -0,0 +1,180 @@
+import re
+import json
+from z3 import *
+from hashlib import sha256
+from collections import OrderedDict
+from pathlib import Path
+from functools import lru_cache
+from dataclasses import asdict, fields, is_dataclass
+from .generator import *
+from .report import *
+
+def structural_key(node):
+  # repr() of several nodes only shows names, so walk the fields instead
+  if is_dataclass(node):
+    return [type(node).__name__] + [structural_key(getattr(node, x.name)) for x in fields(node)]
+  if isinstance(node, (list, tuple)):
+    return [structural_key(x) for x in node]
+  return node
+
+def function_dependencies(table, contract, libraries, variables, functions, func):
+  definitions = table.contracts
+  bindings = bind_libraries(table, libraries)
+  # State variables, libraries and the inheritance list are always part of it
+  dependencies = [contract.base_contracts, variables, libraries]
+  for library in libraries:
+    ty, canonical_name = library.library_name.name.split(' ')
+    dependencies.append(definitions[canonical_name])
+  # Then everything reachable from the function body
+  stack = [func] + variables
+  while stack:
+    item = stack.pop()
+    found = []
+    for node in walk_nodes(item):
+      if isinstance(node, Identifier):
+        # Called functions, their ensures come with the definition
+        found += [x for x in functions if x.name == node.name]
+        # Interfaces and contracts used as ICounter(addr)
+        if node.name in definitions:
+          found.append(definitions[node.name])
+      if isinstance(node, UserDefinedTypeName):
+        found.append(type_search(table, bindings, node))
+    for x in found:
+      if not [y for y in dependencies if y is x]:
+        dependencies.append(x)
+        stack.append(x)
+  return dependencies
+
+@lru_cache(maxsize=None)
+def verifier_version():
+  # Results of an older verifier must not be reused
+  digest = sha256()
+  for path in sorted(Path(__file__).parent.glob('*.py')):
+    digest.update(path.read_bytes())
+  return digest.hexdigest()
+
+def function_digest(table, contract, libraries, variables, functions, func, options):
+  dependencies = function_dependencies(table, contract, libraries, variables, functions, func)
+  # Results name their contract and function, so equal bodies in two
+  # contracts must not share an entry
+  data = json.dumps([
+    verifier_version(),
+    contract.name,
+    structural_key(function_key(func)),
+    structural_key(options),
+    structural_key(func),
+    structural_key(dependencies)
+  ])
+  return sha256(data.encode()).hexdigest()
+
+class VerificationCache:
+  def __init__(self, path):
+    self.path = Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.hits = 0
+    self.misses = 0
+
+  def load(self, key):
+    entry = self.path / key
+    if entry.exists():
+      self.hits += 1
+      return [Result(**x) for x in json.loads(entry.read_text())]
+    self.misses += 1
+    return None
+
+  def store(self, key, results):
+    entry = self.path / key
+    entry.write_text(json.dumps([asdict(x) for x in results]))
+
+class MemoryCache:
+  # Results of the functions verified in this process, used by watch mode
+  # to verify only what changed since the last run
+  def __init__(self, size=4096):
+    self.size = size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def load(self, key):
+    results = self.entries.get(key)
+    if results is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self.entries.move_to_end(key)
+    return results
+
+  def store(self, key, results):
+    self.entries[key] = results
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+
+def query_key(formula):
+  # Fresh constants are renamed in order of appearance, so alpha
+  # equivalent queries share a key. Their sorts are part of the key too
+  formula = simplify(formula)
+  text = formula.sexpr()
+  names = {}
+  def rename(match):
+    return names.setdefault(match.group(0), f'v!{len(names)}')
+  text = re.sub(r'[^\s()|]+![0-9]+', rename, text)
+  # Constants that were simplified away are not part of the key
+  constants = {}
+  stack = [formula]
+  while stack:
+    item = stack.pop()
+    if is_const(item) and item.decl().kind() == Z3_OP_UNINTERPRETED:
+      constants[names.get(str(item), str(item))] = item.sort().sexpr()
+    else:
+      stack += item.children()
+  data = json.dumps([text, sorted(constants.items())])
+  return sha256(data.encode()).hexdigest()
+
+class QueryCache:
+  # Outcomes of decided solver queries, least recently used ones are
+  # evicted first
+  def __init__(self, size=65536, path=None):
+    self.size = size
+    self.path = Path(path) if path else None
+    self.entries = OrderedDict()
+    self.added = []
+    self.hits = 0
+    self.misses = 0
+    if self.path and self.path.exists():
+      self.entries.update(json.loads(self.path.read_text()))
+
+  def get(self, key):
+    outcome = self.entries.get(key)
+    if outcome is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self.entries.move_to_end(key)
+    return outcome
+
+  def put(self, key, outcome):
+    self.entries[key] = outcome
+    self.entries.move_to_end(key)
+    self.added.append(key)
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+
+  def collect(self):
+    # Hands what a worker learned to the parent, see absorb
+    entries = [(x, self.entries[x]) for x in self.added if x in self.entries]
+    stats = entries, self.hits, self.misses
+    self.added, self.hits, self.misses = [], 0, 0
+    return stats
+
+  def absorb(self, stats):
+    entries, hits, misses = stats
+    for key, outcome in entries:
+      self.put(key, outcome)
+    self.added = []
+    self.hits += hits
+    self.misses += misses
+
+  def save(self):
+    if self.path:
+      self.path.write_text(json.dumps(self.entries))
@@ -1,125 +1,358 @@
 from .parser import *
 
-def unroll_loop_statements(statement):
+@dataclass
+class Options:
+  # Loops running longer than unroll_bound are summarized with invariants
+  unroll_bound: Optional[int] = None
+  # Always summarize loops after unroll_bound iterations (k-induction)
+  loop_induction: bool = False
+  # Join both branches of an if into one state instead of forking
+  merge_paths: bool = False
+  # Fork anyway once a merged term grows beyond this many nodes
+  merge_limit: int = 256
+  # Milliseconds and resource units a single solver query may use
+  query_timeout: Optional[int] = None
+  query_rlimit: Optional[int] = None
+  # Seconds and resource units for all queries of one function, once
+  # either is used up the function stops with a timeout result
+  function_timeout: Optional[float] = None
+  function_rlimit: Optional[int] = None
+  # Retry unknown queries with the tactics of retry_ladder
+  retry: bool = False
+  # Encode uintN and address as N bit vectors, with overflow either ruled
+  # out on the path (checked) or wrapping around
+  bitvector: bool = False
+  wrapping: bool = False
+  # Only send the solver conjuncts sharing constants with the checked goal
+  slice_queries: bool = False
+  # Constrain mapping and array values only at the indices used on the
+  # path instead of with a ForAll over every index
+  quantifier_free: bool = False
+  # Stop a function after max_paths paths, drop paths with more than
+  # max_depth branch decisions
+  max_paths: Optional[int] = None
+  max_depth: Optional[int] = None
+
+def call_statement(name, arguments):
+  return ExpressionStatement(
+    FunctionCall('functionCall', Identifier(name), arguments)
+  )
+
+def split_loop_invariants(body):
+  # invariant(...) calls at the top level of the loop body
+  invariants = []
+  statements = []
+  for statement in body.statements if isinstance(body, Block) else [body]:
+    if isinstance(statement, ExpressionStatement):
+      if isinstance(statement.expression, FunctionCall):
+        ident = statement.expression.expression
+        if isinstance(ident, Identifier) and ident.name == 'invariant':
+          invariants += statement.expression.arguments
+          continue
+    statements.append(statement)
+  return invariants, Block(statements)
+
+def assigned_variables(statement):
+  # Variables outside of the loop body that the loop can modify
+  assigned, declared = [], []
+  for node in walk_nodes(statement):
+    target = None
+    if isinstance(node, Assignment):
+      target = node.left_hand_side
+    if isinstance(node, UnaryOperation) and node.operator in ['++', '--']:
+      target = node.sub_expression
+    if isinstance(node, VariableDeclarationStatement):
+      declared += [x.name for x in node.declarations]
+    while isinstance(target, (IndexAccess, MemberAccess)):
+      if isinstance(target, IndexAccess):
+        target = target.base_expression
+      else:
+        target = target.expression
+    if isinstance(target, Identifier) and target.name not in assigned:
+      assigned.append(target.name)
+  return [x for x in assigned if x not in declared]
+
+def summarize_loop(statement, invariants, body, num_unrolled):
+  # The first num_unrolled iterations are explored exactly, then any later
+  # iteration is checked inductively: havoc what the loop modifies, assume
+  # the invariants and the condition, run the body once and check that the
+  # invariants still hold. That path ends there, the exit path continues
+  checks = [call_statement('assert', [x]) for x in invariants]
+  assumes = [call_statement('assume', [x]) for x in invariants]
+  havoc = assigned_variables(Block([body, statement.loop]))
+  step = Block([
+    body,
+    statement.loop,
+    *checks,
+    call_statement('revert', []),
+  ])
+  summary = Block([
+    *checks,
+    call_statement('havoc', [Identifier(x) for x in havoc]),
+    *assumes,
+    IfStatement(statement.condition, step, None),
+  ])
+  for x in range(num_unrolled):
+    summary = IfStatement(
+      statement.condition,
+      Block([*checks, body, statement.loop, summary]),
+      None
+    )
+  return Block([statement.init, summary])
+
+def unroll_loop_statements(statement, options=None):
+  options = options or Options()
   if isinstance(statement, Block):
-    return Block([unroll_loop_statements(x) for x in statement.statements])
+    return Block([unroll_loop_statements(x, options) for x in statement.statements])
   elif isinstance(statement, IfStatement):
     return IfStatement(
       statement.condition,
-      unroll_loop_statements(statement.true_body),
-      unroll_loop_statements(statement.false_body) if statement.false_body else None
+      unroll_loop_statements(statement.true_body, options),
+      unroll_loop_statements(statement.false_body, options) if statement.false_body else None
     )
   elif isinstance(statement, ForStatement):
+    invariants, body = split_loop_invariants(statement.body)
+    body = unroll_loop_statements(body, options)
+    bound = options.unroll_bound
+    if options.loop_induction:
+      return summarize_loop(statement, invariants, body, bound if bound is not None else 1)
     num_unrolled = 2
     ## Heuristic to unroll
     if isinstance(statement.condition, BinaryOperation):
       if isinstance(statement.condition.right_expression, Literal):
         num_unrolled = int(statement.condition.right_expression.value)
+    # Do not let the literal bound blow up the number of statements
+    if bound is not None and num_unrolled > bound:
+      return summarize_loop(statement, invariants, body, bound)
+    checks = [call_statement('assert', [x]) for x in invariants]
     return Block([
       statement.init,
       Block(num_unrolled * [
         statement.condition,
-        statement.body,
+        *checks,
+        body,
         statement.loop,
       ]),
+      *checks,
       UnaryOperation(statement.condition, True, '!'),
     ])
   return statement
 
-def count_if_statements(statement):
-  if isinstance(statement, Block):
-    for statement in statement.statements:
-      yield from count_if_statements(statement)
-  elif isinstance(statement, IfStatement):
-    yield 1
-    yield from count_if_statements(statement.true_body)
-    if statement.false_body:
-      yield from count_if_statements(statement.false_body)
+class PathExplorer:
+  # Hooks called while walking the execution tree. The default explorer
+  # keeps no state and treats every branch as feasible
+  def step(self, statement):
+    pass
 
-def construct_execution_path(statement, path=[]):
-  if isinstance(statement, Block):
-    for statement in statement.statements:
-      yield from construct_execution_path(statement, path)
-  elif isinstance(statement, IfStatement):
-    if path.pop():
-      yield statement.condition
-      yield from construct_execution_path(statement.true_body, path)
+  def branch(self, condition):
+    return True
+
+  def merge(self, statement):
+    return False
+
+  def save(self):
+    return None
+
+  def restore(self, snapshot):
+    pass
+
+  def cutoff(self, statement):
+    pass
+
+def is_revert_statement(statement):
+  if isinstance(statement, ExpressionStatement):
+    if isinstance(statement.expression, FunctionCall):
+      ident = statement.expression.expression
+      if isinstance(ident, Identifier):
+        if ident.name == 'revert': return True
+  return False
+
+def is_terminal_statement(statement):
+  return isinstance(statement, Return) or is_revert_statement(statement)
+
+def has_terminal_statement(statement):
+  for node in walk_nodes(statement):
+    if is_terminal_statement(node): return True
+  return False
+
+def explore_execution_paths(pending, visited, explorer, max_depth=None):
+  # Depth first over the branch decisions without recursion. pending and
+  # visited are linked lists (head, tail) so that both branches of a fork
+  # share the same prefix without copying it, forks holds the untried
+  # branches of every fork on the current path
+  forks = []
+  walking = True
+  while walking:
+    fork = None
+    while pending:
+      statement, pending = pending
+      if isinstance(statement, Block):
+        for x in reversed(statement.statements):
+          pending = (x, pending)
+      elif isinstance(statement, IfStatement) and explorer.merge(statement):
+        visited = (statement, visited)
+      elif isinstance(statement, IfStatement):
+        fork = statement
+        break
+      else:
+        explorer.step(statement)
+        visited = (statement, visited)
+        # Execution path stops at revert and return
+        if is_terminal_statement(statement): break
+    if fork is None:
+      path = []
+      while visited:
+        statement, visited = visited
+        path.append(statement)
+      yield path[::-1]
+    elif max_depth is not None and len(forks) >= max_depth:
+      # Paths with more decisions are dropped, the explorer is told
+      explorer.cutoff(fork)
+    else:
+      branches = [
+        (fork.condition, fork.true_body),
+        (intern_node(UnaryOperation(fork.condition, True, '!')), fork.false_body),
+      ]
+      forks.append([branches, pending, visited, None])
+    # Backtrack to the next feasible branch
+    walking = False
+    while forks and not walking:
+      frame = forks[-1]
+      branches, pending, visited, snapshot = frame
+      if snapshot is not None:
+        explorer.restore(snapshot)
+        frame[3] = None
+      if not branches:
+        forks.pop()
+        continue
+      condition, body = branches.pop(0)
+      snapshot = explorer.save()
+      # Infeasible branches are dropped together with their subtree
+      if explorer.branch(condition):
+        frame[3] = snapshot
+        pending = (body, pending) if body else pending
+        visited = (condition, visited)
+        walking = True
+      else:
+        explorer.restore(snapshot)
+
+def compute_execution_paths(statement, explorer=None, options=None):
+  explorer = explorer or PathExplorer()
+  options = options or Options()
+  statement = unroll_loop_statements(statement, options)
+  yield from explore_execution_paths((statement, None), None, explorer, options.max_depth)
+
+@dataclass
+class MemberTable:
+  # Members of a contract with everything it inherits, resolved once
+  linearization: list
+  variables: list
+  functions: list
+  libraries: list
+  # Indices of the functions verified in this contract, the others are
+  # verified in a base contract that resolves their calls the same way
+  verified: set
+
+def linearize(name, bases, linearizations):
+  # C3 linearization, most derived first. Solidity lists the bases from
+  # the most basic one to the most derived, so they are merged right to left
+  if name in linearizations:
+    if linearizations[name] is None:
+      raise ValueError(f'cyclic inheritance of {name}')
+    return linearizations[name]
+  linearizations[name] = None
+  parents = bases[name][::-1]
+  sequences = [linearize(x, bases, linearizations)[::] for x in parents] + [parents]
+  sequences = [x for x in sequences if x]
+  result = [name]
+  while sequences:
+    for sequence in sequences:
+      head = sequence[0]
+      if not [x for x in sequences if head in x[1:]]: break
     else:
-      yield UnaryOperation(statement.condition, True, '!')
-      if statement.false_body:
-        yield from construct_execution_path(statement.false_body, path)
-  else:
-    yield statement
-
-def compute_visited_paths(statement):
-  num_ifs = sum(count_if_statements(statement))
-  visited_paths = [[]]
-  for x in range(num_ifs):
-    tmp = []
-    for visited in visited_paths:
-      true_branch = visited[::] + [True]
-      false_branch = visited[::] + [False]
-      tmp = tmp + [true_branch, false_branch]
-    visited_paths = tmp
-  return visited_paths
-
-def compute_execution_paths(statement):
-  statement = unroll_loop_statements(statement)
-  for visited in compute_visited_paths(statement):
-    # Execution path stops at revert and return
-    path = []
-    for v in construct_execution_path(statement, visited):
-      path.append(v)
-      if isinstance(v, Return): break
-      if isinstance(v, ExpressionStatement):
-        if isinstance(v.expression, FunctionCall):
-          ident = v.expression.expression
-          if isinstance(ident, Identifier):
-            if ident.name == 'revert': break
-    yield path
-
-def generate_execution_paths(root):
-  # Indexing
-  def handler(contract):
-    variables = [x for x in contract.nodes if isinstance(x, VariableDeclaration)]
-    functions = [x for x in contract.nodes if isinstance(x, FunctionDefinition)]
-    libraries = [x for x in contract.nodes if isinstance(x, UsingForDirective)]
-    return contract.name, (variables, functions, libraries, contract.base_contracts)
-  # -----> For new contract or interface
-  contracts = dict([handler(x) for x in root.nodes if isinstance(x, ContractDefinition)])
-  # -----> Loading from int tree
+      raise ValueError(f'inheritance of {name} can not be linearized')
+    result.append(head)
+    sequences = [x[1:] if x[0] == head else x for x in sequences]
+    sequences = [x for x in sequences if x]
+  linearizations[name] = result
+  return result
+
+def function_key(func):
+  # Overloads are told apart by their parameter types
+  return func.name, tuple([x.type_name for x in func.parameters])
+
+def called_names(func):
+  return set([x.name for x in walk_nodes(func.body) if isinstance(x, Identifier)])
+
+def reachable_functions(by_name, func):
+  # Ids of the functions a call to func can end up in
+  reached, stack = set(), [func]
+  while stack:
+    item = stack.pop()
+    if id(item) in reached: continue
+    reached.add(id(item))
+    for name in called_names(item) & set(by_name):
+      stack += by_name[name]
+  return reached
+
+def build_member_tables(root):
+  definitions = {}
+  for node in root.nodes:
+    if isinstance(node, ContractDefinition):
+      definitions.setdefault(node.name, node)
+  bases = {}
+  for name, contract in definitions.items():
+    bases[name] = []
+    for x in contract.base_contracts:
+      ty, canonical_name = x.base_name.name.split(' ')
+      assert ty == 'contract'
+      bases[name].append(canonical_name)
+  tables, linearizations = {}, {}
+  for name in definitions:
+    order = linearize(name, bases, linearizations)
+    variables, libraries, resolved = [], [], {}
+    # Most basic contract first, overrides replace the function in place
+    for base in reversed(order):
+      for node in definitions[base].nodes:
+        if isinstance(node, VariableDeclaration):
+          variables.append(node)
+        if isinstance(node, UsingForDirective):
+          libraries.append(node)
+        if isinstance(node, FunctionDefinition):
+          resolved[function_key(node)] = node
+    tables[name] = MemberTable(order, variables, list(resolved.values()), libraries, set())
+  index = {}
+  for name, table in tables.items():
+    by_name = {}
+    for func in table.functions:
+      by_name.setdefault(func.name, []).append(func)
+    index[name] = by_name, set([id(x) for x in table.functions])
+  for name, table in tables.items():
+    by_name, ids = index[name]
+    for idx, func in enumerate(table.functions):
+      # An inherited function is verified again only if no base contract
+      # resolves the functions it reaches the same way
+      reached = reachable_functions(by_name, func)
+      for base in table.linearization[1:]:
+        base_names, base_ids = index[base]
+        if id(func) in base_ids and reachable_functions(base_names, func) == reached: break
+      else:
+        table.verified.add(idx)
+  return tables
+
+def generate_contracts(root):
+  # Linearization and members of every contract are computed once
+  tables = build_member_tables(root)
   for contract in root.nodes:
     if isinstance(contract, ContractDefinition):
-      variables = []
-      functions = []
-      libraries = []
-      # ----> Inherit tree
-      base_contracts = []
-      stack = contract.base_contracts[::]
-      while stack:
-        item = stack.pop()
-        found = [x for x in base_contracts if x == item]
-        if not found: base_contracts.append(item)
-        ty, canonical_name = item.base_name.name.split(' ')
-        assert ty == 'contract'
-        stack += contracts[canonical_name][3][::]
-      # ----> Inherit properties
-      for iht in base_contracts:
-        ty, canonical_name = iht.base_name.name.split(' ')
-        assert ty == 'contract'
-        variables += contracts[canonical_name][0]
-        functions += contracts[canonical_name][1]
-        libraries += contracts[canonical_name][2]
-      # ----> MyOwn
-      variables += contracts[contract.name][0]
-      functions += contracts[contract.name][1]
-      libraries += contracts[contract.name][2]
-      # ----> Start verifing
-      print(f'contract {contract.name}')
-      for func in functions:
-        if isinstance(func, FunctionDefinition):
-          if func.visibility in ['public', 'external']:
-            if func.body and func.body.statements:
-              print(f'  func {func.name}')
-              for path in compute_execution_paths(func.body):
-                yield contracts, libraries, variables, functions, func, path
\ No newline at end of file
+      table = tables[contract.name]
+      yield contract, tables, table.libraries, table.variables, table.functions
+
+def is_verified_function(func):
+  # Private and internal functions are verified once against their own
+  # specification instead of inside every caller
+  if isinstance(func, FunctionDefinition):
+    if func.visibility in ['public', 'external', 'internal', 'private']:
+      if func.body and func.body.statements:
+        return True
+  return False
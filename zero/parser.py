@@ -1,226 +1,358 @@
+import json
 from .ast import *
 
-def type_search(root, libraries, type_name):
-
+@dataclass
+class SymbolTable:
+  contracts: dict
+  structs: dict
+
+def build_symbol_table(root):
+  contracts = {}
+  # Global structures for msg and block
+  structs = {
+    'Msg': StructDefinition('struct Msg', [
+      VariableDeclaration('sender', ElementaryTypeName('address')),
+      VariableDeclaration('value', ElementaryTypeName('uint'))
+    ]),
+    'Block': StructDefinition('struct Block', [
+      VariableDeclaration('number', ElementaryTypeName('uint')),
+      VariableDeclaration('timestamp', ElementaryTypeName('uint'))
+    ]),
+  }
+  for node in root.nodes:
+    if isinstance(node, ContractDefinition):
+      # First definition wins as it did with a linear search
+      contracts.setdefault(node.name, node)
+      for part in node.nodes:
+        if isinstance(part, StructDefinition):
+          structs.setdefault(f'{node.name}.{part.name}', part)
+  return SymbolTable(contracts, structs)
+
+def bind_libraries(table, libraries):
+  # Libraries attached to simple type names with using for
+  bindings = {}
+  for library in libraries:
+    if isinstance(library.type_name, ElementaryTypeName):
+      ty, canonical_name = library.library_name.name.split(' ')
+      node = table.contracts.get(canonical_name)
+      if node and node.kind == ty:
+        bindings.setdefault(library.type_name.name, node)
+  return bindings
+
+def type_search(table, bindings, type_name):
   # Search library for simple type name
   if isinstance(type_name, ElementaryTypeName):
-    for library in libraries:
-      if library.type_name == type_name:
-        library_name = library.library_name.name
-        ty, canonical_name = library_name.split(' ')
-        for node in root.nodes:
-          if isinstance(node, ContractDefinition):
-            if node.kind == ty and node.name == canonical_name:
-              yield node
+    if type_name.name in bindings:
+      return bindings[type_name.name]
   # Search for contract or struct definition
   if isinstance(type_name, UserDefinedTypeName):
     ty, canonical_name = type_name.name.split(' ')
-    # If is struct definition
-    if ty == 'struct':
-      # Global structure for msg
-      if canonical_name == 'Msg':
-        members = [
-          VariableDeclaration('sender', ElementaryTypeName('address')),
-          VariableDeclaration('value', ElementaryTypeName('uint'))
-        ]
-        yield StructDefinition('struct Msg', members)
-      elif canonical_name == 'Block':
-        members = [
-          VariableDeclaration('number', ElementaryTypeName('uint')),
-          VariableDeclaration('timestamp', ElementaryTypeName('uint'))
-        ]
-        yield StructDefinition('struct Block', members)
-      else:
-        contract_name, struct_name = canonical_name.split('.')
-        for node in root.nodes:
-          if isinstance(node, ContractDefinition):
-            if node.name == contract_name:
-              for part in node.nodes:
-                if isinstance(part, StructDefinition):
-                  if part.name == struct_name:
-                    yield part
-    # If is contract definition
-    if ty == 'contract':
-      for node in root.nodes:
-          if isinstance(node, ContractDefinition):
-            if node.name == canonical_name:
-              yield node
-
+    if ty == 'struct' and canonical_name in table.structs:
+      return table.structs[canonical_name]
+    if ty == 'contract' and canonical_name in table.contracts:
+      return table.contracts[canonical_name]
   raise ValueError(type_name)
 
-def parse(node):
+def parse_source_unit(node):
+  nodes = [parse(x) for x in node['nodes']]
+  return SourceUnit(nodes)
+
+def parse_contract_definition(node):
+  kind = node['contractKind']
+  name = node['name']
+  base_contracts = [parse(x) for x in node['baseContracts']]
+  nodes  = [parse(x) for x in node['nodes']]
+  return ContractDefinition(base_contracts, kind, name, nodes)
+
+def parse_function_definition(node):
+  name = node['name']
+  parameters = [parse(x) for x in node['parameters']['parameters']]
+  returns = [parse(x) for x in node['returnParameters']['parameters']]
+  body = parse(node['body']) if node['body'] else None
+  visibility = node['visibility']
+  modifiers = [parse(x) for x in node['modifiers']]
+  return FunctionDefinition(name, parameters, returns, body, visibility, modifiers)
+
+def parse_variable_declaration(node):
+  name = node['name']
+  type_name = parse(node['typeName'])
+  return VariableDeclaration(name, type_name)
+
+def parse_elementary_type_name(node):
+  name = node['name']
+  return ElementaryTypeName(name)
+
+def parse_block(node):
+  statements = [parse(x) for x in node['statements']]
+  return Block(statements)
+
+def parse_expression_statement(node):
+  expression = parse(node['expression'])
+  return ExpressionStatement(expression)
+
+def parse_assignment(node):
+  left_hand_side = parse(node['leftHandSide'])
+  right_hand_side = parse(node['rightHandSide'])
+  operator = node['operator']
+  return Assignment(left_hand_side, right_hand_side, operator)
+
+def parse_identifier(node):
+  name = node['name']
+  return Identifier(name)
+
+def parse_binary_operation(node):
+  left_expression = parse(node['leftExpression'])
+  right_expression = parse(node['rightExpression'])
+  operator = node['operator']
+  return BinaryOperation(left_expression, right_expression, operator)
+
+def parse_if_statement(node):
+  condition = parse(node['condition'])
+  true_body = parse(node['trueBody'])
+  false_body = parse(node['falseBody']) if node['falseBody'] else None
+  return IfStatement(condition, true_body, false_body)
+
+def parse_unary_operation(node):
+  sub_expression = parse(node['subExpression'])
+  prefix = node['prefix']
+  operator = node['operator']
+  return UnaryOperation(sub_expression, prefix, operator)
+
+def parse_tuple_expression(node):
+  components = [parse(x) for x in node['components']]
+  return TupleExpression(components)
+
+def parse_literal(node):
+  kind = node['kind']
+  value = node['value']
+  return Literal(kind, value)
+
+def parse_function_call(node):
+  kind = node['kind']
+  expression = parse(node['expression'])
+  arguments = [parse(x) for x in node['arguments']]
+  return FunctionCall(kind, expression, arguments)
+
+def parse_mapping(node):
+  key_type = parse(node['keyType'])
+  value_type = parse(node['valueType'])
+  return Mapping(key_type, value_type)
+
+def parse_index_access(node):
+  index_expression = parse(node['indexExpression'])
+  base_expression = parse(node['baseExpression'])
+  return IndexAccess(index_expression, base_expression)
+
+def parse_member_access(node):
+  member_name = node['memberName']
+  expression = parse(node['expression'])
+  return MemberAccess(member_name, expression)
+
+def parse_struct_definition(node):
+  name = node['name']
+  members = [parse(x) for x in node['members']]
+  return StructDefinition(name, members)
+
+def parse_user_defined_type_name(node):
+  name = node['typeDescriptions']['typeString']
+  return UserDefinedTypeName(name)
+
+def parse_array_type_name(node):
+  base_type = parse(node['baseType'])
+  length = parse(node['length']) if node['length'] else None
+  return ArrayTypeName(base_type, length)
+
+def parse_variable_declaration_statement(node):
+  declarations = [parse(x) for x in node['declarations']]
+  initial_value = parse(node['initialValue']) if node['initialValue'] else None
+  return VariableDeclarationStatement(declarations, initial_value)
+
+def parse_for_statement(node):
+  init = parse(node['initializationExpression'])
+  condition = parse(node['condition'])
+  loop = parse(node['loopExpression'])
+  body = parse(node['body'])
+  return ForStatement(init, condition, loop, body)
+
+def parse_return(node):
+  expression = parse(node['expression']) if node['expression'] else None
+  return Return(expression)
+
+def parse_elementary_type_name_expression(node):
+  return ElementaryTypeNameExpression(node['typeName'])
+
+def parse_using_for_directive(node):
+  type_name = parse(node['typeName'])
+  library_name = parse(node['libraryName'])
+  return UsingForDirective(type_name, library_name)
+
+def parse_emit_statement(node):
+  return EmitStatement()
+
+def parse_event_definition(node):
+  name = node['name']
+  return EventDefinition(name)
+
+def parse_modifier_definition(node):
+  body = parse(node['body'])
+  parameters = [parse(x) for x in node['parameters']['parameters']]
+  return ModifierDefinition(body, parameters)
+
+def parse_inheritance_specifier(node):
+  base_name = parse(node['baseName'])
+  return InheritanceSpecifier(base_name)
+
+def parse_modifier_invocation(node):
+  modifier_name = parse(node['modifierName'])
+  arguments = [parse(x) for x in node['arguments']] if node['arguments'] else []
+  return ModifierInvocation(modifier_name, arguments)
+
+def parse_placeholder_statement(node):
+  return PlaceholderStatement()
+
+def parse_conditional(node):
+  condition = parse(node['condition'])
+  true_expression = parse(node['trueExpression'])
+  false_expression = parse(node['falseExpression'])
+  return Conditional(condition, true_expression, false_expression)
+
+def parse_inline_assembly(node):
+  return InlineAssembly()
+
+def parse_pragma_directive(node):
+  return PragmaDirective()
+
+def parse_new_expression(node):
+  type_name = parse(node['typeName'])
+  return NewExpression(type_name)
+
+parsers = {
+  'SourceUnit': parse_source_unit,
+  'ContractDefinition': parse_contract_definition,
+  'FunctionDefinition': parse_function_definition,
+  'VariableDeclaration': parse_variable_declaration,
+  'ElementaryTypeName': parse_elementary_type_name,
+  'Block': parse_block,
+  'ExpressionStatement': parse_expression_statement,
+  'Assignment': parse_assignment,
+  'Identifier': parse_identifier,
+  'BinaryOperation': parse_binary_operation,
+  'IfStatement': parse_if_statement,
+  'UnaryOperation': parse_unary_operation,
+  'TupleExpression': parse_tuple_expression,
+  'Literal': parse_literal,
+  'FunctionCall': parse_function_call,
+  'Mapping': parse_mapping,
+  'IndexAccess': parse_index_access,
+  'MemberAccess': parse_member_access,
+  'StructDefinition': parse_struct_definition,
+  'UserDefinedTypeName': parse_user_defined_type_name,
+  'ArrayTypeName': parse_array_type_name,
+  'VariableDeclarationStatement': parse_variable_declaration_statement,
+  'ForStatement': parse_for_statement,
+  'Return': parse_return,
+  'ElementaryTypeNameExpression': parse_elementary_type_name_expression,
+  'UsingForDirective': parse_using_for_directive,
+  'EmitStatement': parse_emit_statement,
+  'EventDefinition': parse_event_definition,
+  'ModifierDefinition': parse_modifier_definition,
+  'InheritanceSpecifier': parse_inheritance_specifier,
+  'ModifierInvocation': parse_modifier_invocation,
+  'PlaceholderStatement': parse_placeholder_statement,
+  'Conditional': parse_conditional,
+  'InlineAssembly': parse_inline_assembly,
+  'PragmaDirective': parse_pragma_directive,
+  'NewExpression': parse_new_expression,
+}
 
-  if node['nodeType'] == 'SourceUnit':
-    nodes = [parse(x) for x in node['nodes']]
-    return SourceUnit(nodes)
-
-  if node['nodeType'] == 'ContractDefinition':
-    kind = node['contractKind']
-    name = node['name']
-    base_contracts = [parse(x) for x in node['baseContracts']]
-    nodes  = [parse(x) for x in node['nodes']]
-    return ContractDefinition(base_contracts, kind, name, nodes)
-
-  if node['nodeType'] == 'FunctionDefinition':
-    name = node['name']
-    parameters = [parse(x) for x in node['parameters']['parameters']]
-    returns = [parse(x) for x in node['returnParameters']['parameters']]
-    body = parse(node['body']) if node['body'] else None
-    visibility = node['visibility']
-    modifiers = [parse(x) for x in node['modifiers']]
-    return FunctionDefinition(name, parameters, returns, body, visibility, modifiers)
-
-  if node['nodeType'] == 'VariableDeclaration':
-    name = node['name']
-    type_name = parse(node['typeName'])
-    return VariableDeclaration(name, type_name)
-
-  if node['nodeType'] == 'ElementaryTypeName':
-    name = node['name']
-    return ElementaryTypeName(name)
-
-  if node['nodeType'] == 'Block':
-    statements = [parse(x) for x in node['statements']]
-    return Block(statements)
-
-  if node['nodeType'] == 'ExpressionStatement':
-    expression = parse(node['expression'])
-    return ExpressionStatement(expression)
-
-  if node['nodeType'] == 'Assignment':
-    left_hand_side = parse(node['leftHandSide'])
-    right_hand_side = parse(node['rightHandSide'])
-    operator = node['operator']
-    return Assignment(left_hand_side, right_hand_side, operator)
-
-  if node['nodeType'] == 'Identifier':
-    name = node['name']
-    return Identifier(name)
-
-  if node['nodeType'] == 'BinaryOperation':
-    left_expression = parse(node['leftExpression'])
-    right_expression = parse(node['rightExpression'])
-    operator = node['operator']
-    return BinaryOperation(left_expression, right_expression, operator)
-
-  if node['nodeType'] == 'IfStatement':
-    condition = parse(node['condition'])
-    true_body = parse(node['trueBody'])
-    false_body = parse(node['falseBody']) if node['falseBody'] else None
-    return IfStatement(condition, true_body, false_body)
-
-  if node['nodeType'] == 'UnaryOperation':
-    sub_expression = parse(node['subExpression'])
-    prefix = node['prefix']
-    operator = node['operator']
-    return UnaryOperation(sub_expression, prefix, operator)
-
-  if node['nodeType'] == 'TupleExpression':
-    components = [parse(x) for x in node['components']]
-    return TupleExpression(components)
-
-  if node['nodeType'] == 'Literal':
-    kind = node['kind']
-    value = node['value']
-    return Literal(kind, value)
-
-  if node['nodeType'] == 'FunctionCall':
-    kind = node['kind']
-    expression = parse(node['expression'])
-    arguments = [parse(x) for x in node['arguments']]
-    return FunctionCall(kind, expression, arguments)
-
-  if node['nodeType'] == 'Mapping':
-    key_type = parse(node['keyType'])
-    value_type = parse(node['valueType'])
-    return Mapping(key_type, value_type)
-
-  if node['nodeType'] == 'IndexAccess':
-    index_expression = parse(node['indexExpression'])
-    base_expression = parse(node['baseExpression'])
-    return IndexAccess(index_expression, base_expression)
-
-  if node['nodeType'] == 'MemberAccess':
-    member_name = node['memberName']
-    expression = parse(node['expression'])
-    return MemberAccess(member_name, expression)
-
-  if node['nodeType'] == 'StructDefinition':
-    name = node['name']
-    members = [parse(x) for x in node['members']]
-    return StructDefinition(name, members)
-
-  if node['nodeType'] == 'UserDefinedTypeName':
-    name = node['typeDescriptions']['typeString']
-    return UserDefinedTypeName(name)
-
-  if node['nodeType'] == 'ArrayTypeName':
-    base_type = parse(node['baseType'])
-    length = parse(node['length']) if node['length'] else None
-    return ArrayTypeName(base_type, length)
-
-  if node['nodeType'] == 'VariableDeclarationStatement':
-    declarations = [parse(x) for x in node['declarations']]
-    initial_value = parse(node['initialValue']) if node['initialValue'] else None
-    return VariableDeclarationStatement(declarations, initial_value)
-
-  if node['nodeType'] == 'ForStatement':
-    init = parse(node['initializationExpression'])
-    condition = parse(node['condition'])
-    loop = parse(node['loopExpression'])
-    body = parse(node['body'])
-    return ForStatement(init, condition, loop, body)
-
-  if node['nodeType'] == 'Return':
-    expression = parse(node['expression']) if node['expression'] else None
-    return Return(expression)
-
-  if node['nodeType'] == 'ElementaryTypeNameExpression':
-    return ElementaryTypeNameExpression(node['typeName'])
-
-  if node['nodeType'] == 'UsingForDirective':
-    type_name = parse(node['typeName'])
-    library_name = parse(node['libraryName'])
-    return UsingForDirective(type_name, library_name)
-
-  if node['nodeType'] == 'EmitStatement':
-    return EmitStatement()
-
-  if node['nodeType'] == 'EventDefinition':
-    name = node['name']
-    return EventDefinition(name)
-
-  if node['nodeType'] == 'ModifierDefinition':
-    body = parse(node['body'])
-    parameters = [parse(x) for x in node['parameters']['parameters']]
-    return ModifierDefinition(body, parameters)
-
-  if node['nodeType'] == 'InheritanceSpecifier':
-    base_name = parse(node['baseName'])
-    return InheritanceSpecifier(base_name)
-
-  if node['nodeType'] == 'ModifierInvocation':
-    modifier_name = parse(node['modifierName'])
-    arguments = [parse(x) for x in node['arguments']] if node['arguments'] else []
-    return ModifierInvocation(modifier_name, arguments)
-
-  if node['nodeType'] == 'PlaceholderStatement':
-    return PlaceholderStatement()
-
-  if node['nodeType'] == 'Conditional':
-    condition = parse(node['condition'])
-    true_expression = parse(node['trueExpression'])
-    false_expression = parse(node['falseExpression'])
-    return Conditional(condition, true_expression, false_expression)
-
-  if node['nodeType'] == 'InlineAssembly':
-    return InlineAssembly()
-
-  if node['nodeType'] == 'PragmaDirective':
-    return PragmaDirective()
-
-  if node['nodeType'] == 'NewExpression':
-    type_name = parse(node['typeName'])
-    return NewExpression(type_name)
-
-  raise ValueError(node['nodeType'])
\ No newline at end of file
+def parse(node):
+  # Constant time dispatch on the node type
+  handler = parsers.get(node['nodeType'])
+  if not handler:
+    raise ValueError(node['nodeType'])
+  # Children are interned first, so equal subtrees become one object
+  return intern_node(handler(node))
+
+class JSONStream:
+  # Reads a JSON document piece by piece, keeping at most one top level
+  # value of the source unit in memory at a time
+  def __init__(self, fp, chunk_size=1 << 16):
+    self.fp = fp
+    self.chunk_size = chunk_size
+    self.buffer = ''
+    self.offset = 0
+    self.decoder = json.JSONDecoder()
+
+  def fill(self, size):
+    chunk = self.fp.read(size)
+    self.buffer = self.buffer[self.offset:] + chunk
+    self.offset = 0
+    return bool(chunk)
+
+  def find(self, char):
+    # Skips anything up to char, e.g. the headers printed by solc
+    while True:
+      idx = self.buffer.find(char, self.offset)
+      if idx >= 0:
+        self.offset = idx + 1
+        return True
+      self.offset = len(self.buffer)
+      if not self.fill(self.chunk_size): return False
+
+  def peek(self):
+    while True:
+      while self.offset < len(self.buffer) and self.buffer[self.offset].isspace():
+        self.offset += 1
+      if self.offset < len(self.buffer):
+        return self.buffer[self.offset]
+      if not self.fill(self.chunk_size):
+        raise ValueError('unexpected end of json stream')
+
+  def expect(self, *chars):
+    char = self.peek()
+    if char not in chars:
+      raise ValueError(f'expected {chars} at {char!r}')
+    self.offset += 1
+    return char
+
+  def value(self):
+    self.peek()
+    size = self.chunk_size
+    while True:
+      # A value touching the end of the buffer may still be truncated
+      try:
+        value, end = self.decoder.raw_decode(self.buffer, self.offset)
+        if end < len(self.buffer):
+          self.offset = end
+          return value
+      except json.JSONDecodeError:
+        pass
+      # Double the read size so large values are decoded in linear time
+      size = max(size, len(self.buffer) - self.offset)
+      if not self.fill(size):
+        value, end = self.decoder.raw_decode(self.buffer, self.offset)
+        self.offset = end
+        return value
+
+def parse_stream(fp):
+  # Parse compact json of solc contract by contract, every source unit
+  # found in the stream is merged into one
+  stream = JSONStream(fp)
+  nodes = []
+  while stream.find('{'):
+    if stream.peek() == '}': continue
+    while True:
+      key = stream.value()
+      stream.expect(':')
+      if key == 'nodes':
+        stream.expect('[')
+        if stream.peek() == ']':
+          stream.expect(']')
+        else:
+          while True:
+            nodes.append(parse(stream.value()))
+            if stream.expect(',', ']') == ']': break
+      else:
+        stream.value()
+      if stream.expect(',', '}') == '}': break
+  return SourceUnit(nodes)
@@ -0,0 +1,91 @@
+from time import perf_counter
+from contextlib import contextmanager
+
+class Profiler:
+  # Wall time and count per stack of nested phases, paths and solver
+  # queries are recorded one by one
+  def __init__(self):
+    self.stack = []
+    self.times = {}
+    self.paths = []
+    self.queries = []
+
+  @contextmanager
+  def phase(self, name):
+    self.stack.append(name)
+    key = tuple(self.stack)
+    start = perf_counter()
+    try:
+      yield
+    finally:
+      entry = self.times.setdefault(key, [0.0, 0])
+      entry[0] += perf_counter() - start
+      entry[1] += 1
+      self.stack.pop()
+
+  def path(self, function, path, elapsed):
+    self.paths.append((function, path, elapsed))
+
+  def query(self, function, outcome, elapsed, size, quantifiers, statistics):
+    self.queries.append({
+      'function': function,
+      'stack': ';'.join(self.stack),
+      'outcome': outcome,
+      'time': elapsed,
+      'size': size,
+      'quantifiers': quantifiers,
+      'statistics': statistics,
+    })
+
+  def collect(self):
+    # Hands what a worker measured to the parent, see absorb
+    data = self.times, self.paths, self.queries
+    self.times, self.paths, self.queries = {}, [], []
+    return data
+
+  def absorb(self, data):
+    times, paths, queries = data
+    prefix = tuple(self.stack)
+    for key, (elapsed, count) in times.items():
+      entry = self.times.setdefault(prefix + key, [0.0, 0])
+      entry[0] += elapsed
+      entry[1] += count
+    self.paths += paths
+    self.queries += queries
+
+  def self_times(self):
+    # Time of a stack without the time of the stacks nested in it
+    result = dict([(key, elapsed) for key, (elapsed, count) in self.times.items()])
+    for key, (elapsed, count) in self.times.items():
+      if key[:-1] in result:
+        result[key[:-1]] -= elapsed
+    return result
+
+  def write_folded(self, fp):
+    # One line per stack with its self time in microseconds, the input
+    # format of flamegraph.pl and speedscope
+    for key, elapsed in sorted(self.self_times().items()):
+      fp.write(f'{";".join(key)} {max(int(elapsed * 1e6), 0)}\n')
+
+  def write_report(self, fp, limit=10):
+    self_times = self.self_times()
+    fp.write('phases\n')
+    for key, (elapsed, count) in sorted(self.times.items(), key=lambda x: -x[1][0]):
+      fp.write(f'  {elapsed:10.4f}s {self_times[key]:10.4f}s {count:8d}  {";".join(key)}\n')
+    functions = {}
+    for function, path, elapsed in self.paths:
+      total = functions.setdefault(function, [0.0, 0])
+      total[0] += elapsed
+      total[1] += 1
+    fp.write('functions\n')
+    for function, (elapsed, count) in sorted(functions.items(), key=lambda x: -x[1][0]):
+      fp.write(f'  {elapsed:10.4f}s {count:8d} paths  {function}\n')
+    fp.write('paths\n')
+    for function, path, elapsed in sorted(self.paths, key=lambda x: -x[2])[:limit]:
+      fp.write(f'  {elapsed:10.4f}s  {function} path {path}\n')
+    fp.write('queries\n')
+    for query in sorted(self.queries, key=lambda x: -x['time'])[:limit]:
+      fp.write(
+        f'  {query["time"]:10.4f}s {query["outcome"]:>7} size {query["size"]:6d} '
+        f'forall {query["quantifiers"]:3d}  {query["function"]} {query["stack"]}\n'
+      )
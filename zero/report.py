@@ -0,0 +1,113 @@
+import json
+from typing import Any, Optional
+from dataclasses import dataclass, asdict
+from termcolor import colored
+
+@dataclass
+class Result:
+  contract: str
+  function: str
+  path: int
+  kind: str
+  assertion: str
+  status: str
+  time: float
+  model: Optional[Any] = None
+  trace: Optional[Any] = None
+
+def format_value(value):
+  if isinstance(value, dict) and 'entries' in value:
+    entries = [f'{k}: {format_value(v)}' for k, v in value['entries'].items()]
+    return '{' + ', '.join(entries + [f'_: {format_value(value["default"])}']) + '}'
+  if isinstance(value, dict):
+    return '{' + ', '.join([f'{k}: {format_value(v)}' for k, v in value.items()]) + '}'
+  return json.dumps(value)
+
+class ConsoleWriter:
+  colors = {'proved': 'green', 'falsified': 'yellow', 'unknown': 'yellow'}
+
+  def __init__(self, trace=False):
+    self.contract = None
+    self.function = None
+    self.trace = trace
+
+  def write(self, result):
+    if result.contract != self.contract:
+      self.contract, self.function = result.contract, None
+      print(f'contract {result.contract}')
+    if result.function != self.function:
+      self.function = result.function
+      print(f'  func {result.function}')
+    text = f'    {result.kind}({result.assertion})'
+    print(colored(text, self.colors[result.status]))
+    if result.model:
+      values = ', '.join([f'{k} = {format_value(v)}' for k, v in result.model.items()])
+      print(f'      counterexample: {values}')
+    if self.trace and result.trace:
+      for step in result.trace:
+        values = ', '.join([f'{k} = {format_value(v)}' for k, v in step['values'].items()])
+        print(f'        {step["statement"]}' + (f'  // {values}' if values else ''))
+
+  def close(self):
+    pass
+
+class JSONLinesWriter:
+  def __init__(self, fp):
+    self.fp = fp
+
+  def write(self, result):
+    self.fp.write(json.dumps(asdict(result)) + '\n')
+
+  def close(self):
+    self.fp.flush()
+
+class SarifWriter:
+  # SARIF 2.1.0, every check becomes a result of the assert or ok rule,
+  # paths left out by max_paths or max_depth one of the bound rule and
+  # functions stopped by their budget one of the timeout rule
+  # A level other than none is only allowed with the fail kind, so unknown
+  # results are failures of warning level
+  kinds = {'proved': 'pass', 'falsified': 'fail', 'unknown': 'fail'}
+  levels = {'proved': 'none', 'falsified': 'error', 'unknown': 'warning'}
+
+  def __init__(self, fp):
+    self.fp = fp
+    self.results = []
+
+  def write(self, result):
+    self.results.append({
+      'ruleId': result.kind,
+      'kind': self.kinds[result.status],
+      'level': self.levels[result.status],
+      'message': {'text': f'{result.kind}({result.assertion}) is {result.status}'},
+      'logicalLocations': [{
+        'fullyQualifiedName': f'{result.contract}.{result.function}',
+        'kind': 'function',
+      }],
+      'properties': {
+        'path': result.path,
+        'time': result.time,
+        'model': result.model,
+        'trace': result.trace,
+      },
+    })
+
+  def close(self):
+    log = {
+      'version': '2.1.0',
+      '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+      'runs': [{
+        'tool': {'driver': {
+          'name': 'zero',
+          'rules': [
+            {'id': 'assert', 'shortDescription': {'text': 'assertion holds on every path'}},
+            {'id': 'ok', 'shortDescription': {'text': 'condition is reachable'}},
+            {'id': 'bound', 'shortDescription': {'text': 'every path of the function was explored'}},
+            {'id': 'timeout', 'shortDescription': {'text': 'the function was verified within its budget'}},
+          ],
+        }},
+        'results': self.results,
+      }],
+    }
+    json.dump(log, self.fp, indent=2)
+    self.fp.flush()
@@ -1,22 +1,143 @@
 from z3 import *
 from .generator import *
 from .visitor import *
+from .cache import *
+from .report import *
+from .profiler import *
 from copy import copy
-from termcolor import colored
-from dataclasses import field
+from dataclasses import field, astuple, replace
 from functools import partial
 from itertools import islice
+from multiprocessing import Pool
+from time import perf_counter
+from contextlib import nullcontext
 
 state = None
 search = None
+options = Options()
 gn = None
 before_all = []
 after_all = []
+results = None
+context = None
+path_id = 0
+inputs = {}
+deadline = None
+budget = None
+queries = None
+profiler = None
+
+sorts = {}
+recursive = {}
+# Variables every function of a contract starts with, see prepare_function
+prologues = {}
+
+def type_key(type_name):
+  if isinstance(type_name, ElementaryTypeName):
+    return type_name.name
+  if isinstance(type_name, Mapping):
+    return f'mapping({type_key(type_name.key_type)} => {type_key(type_name.value_type)})'
+  if isinstance(type_name, UserDefinedTypeName):
+    return type_name.name
+  if isinstance(type_name, ArrayTypeName):
+    length = type_name.length.value if type_name.length else ''
+    return f'{type_key(type_name.base_type)}[{length}]'
+  raise ValueError(type_name)
+
+def bit_width(type_name):
+  # Declared width of uintN and address, None for other types
+  if isinstance(type_name, ElementaryTypeName):
+    if type_name.name == 'address': return 160
+    if type_name.name.startswith('uint'):
+      return int(type_name.name[4:] or 256)
+  if isinstance(type_name, UserDefinedTypeName):
+    if type_name.name.startswith('contract '): return 160
+  return None
+
+def cast(val, sort):
+  if val.sort() == sort: return val
+  if is_bv_sort(sort):
+    if is_int_value(val) or is_bv_value(val):
+      return BitVecVal(val.as_long(), sort.size())
+    if is_int(val):
+      return Int2BV(val, sort.size())
+    if is_bv(val) and val.size() < sort.size():
+      return ZeroExt(sort.size() - val.size(), val)
+    if is_bv(val):
+      return Extract(sort.size() - 1, 0, val)
+  if sort == IntSort() and is_bv(val):
+    return BV2Int(val)
+  return val
+
+def is_numeral(val):
+  return is_int_value(val) or is_bv_value(val)
+
+def align(a, b):
+  if not (is_bv(a) and (is_bv(b) or is_arith(b)) or is_bv(b) and is_arith(a)):
+    return a, b
+  # Integer terms take the width of the bit vector
+  if not is_bv(a) and not is_numeral(a):
+    return cast(a, b.sort()), b
+  if not is_bv(b) and not is_numeral(b):
+    return a, cast(b, a.sort())
+  if is_numeral(a) and is_numeral(b):
+    # Numerals keep their full width, a narrower one would overflow
+    size = max([x.size() for x in [a, b] if is_bv(x)])
+  else:
+    # A numeral takes the width of the bit vector if its value fits,
+    # otherwise the bit vector is zero extended, so it is never truncated
+    size = max([max(x.as_long().bit_length(), 1) if is_numeral(x) else x.size() for x in [a, b]])
+  return cast(a, BitVecSort(size)), cast(b, BitVecSort(size))
+
+def convert(var, type_name):
+  # Stored values keep the declared width of the variable
+  if isinstance(var, VariableRef) and is_bv(var.val) and bit_width(type_name):
+    return VariableRef(type_name, cast(var.val, sort_for_type_name(type_name)), var.constraint)
+  return var
+
+def lt(a, b):
+  a, b = align(a, b)
+  return ULT(a, b) if is_bv(a) else a < b
+
+def le(a, b):
+  a, b = align(a, b)
+  return ULE(a, b) if is_bv(a) else a <= b
+
+def gt(a, b):
+  a, b = align(a, b)
+  return UGT(a, b) if is_bv(a) else a > b
+
+def ge(a, b):
+  a, b = align(a, b)
+  return UGE(a, b) if is_bv(a) else a >= b
+
+def store_lemmas(val, index, value_type):
+  # The stored index is the only new value of the array
+  if not options.quantifier_free: return []
+  return [constraint_for_type_name(val[index], value_type)]
+
+def no_overflow(operator, a, b):
+  # Checked arithmetic, paths that overflow revert
+  if not is_bv(a) or not state.arith_check: return []
+  if operator == '+': return [BVAddNoOverflow(a, b, False)]
+  if operator == '-': return [BVSubNoUnderflow(a, b, False)]
+  if operator == '*': return [BVMulNoOverflow(a, b, False)]
+  return []
 
 def sort_for_type_name(type_name):
+  # Every use of a type shares one sort, so equally named structs are
+  # never declared twice as unrelated datatypes
+  key = type_key(type_name)
+  if key in recursive:
+    recursive[key] = True
+  if key not in sorts:
+    sorts[key] = make_sort_for_type_name(type_name)
+  return sorts[key]
+
+def make_sort_for_type_name(type_name):
   if isinstance(type_name, ElementaryTypeName):
     if type_name.name.startswith('uint') or type_name.name == 'address':
-      return IntSort()
+      return BitVecSort(bit_width(type_name)) if options.bitvector else IntSort()
     if type_name.name == 'bool':
       return BoolSort()
     if type_name.name == 'string':
@@ -27,20 +148,30 @@ def sort_for_type_name(type_name):
     return ArraySort(key_sort, value_sort)
   if isinstance(type_name, UserDefinedTypeName):
     ty, canonical_name = type_name.name.split(' ')
-    if ty == 'contract': return IntSort()
-    referenced = next(search(type_name))
+    if ty == 'contract':
+      return BitVecSort(bit_width(type_name)) if options.bitvector else IntSort()
+    referenced = search(type_name)
     if isinstance(referenced, StructDefinition):
+      # Members may refer back to the struct through its name
+      sorts[type_name.name] = DatatypeSort(type_name.name)
+      recursive[type_name.name] = False
       dt = Datatype(type_name.name)
       members = [(x.name, sort_for_type_name(x.type_name)) for x in referenced.members]
       dt.declare('data', *members)
+      # Recursive datatypes are only well-founded with a base constructor
+      if recursive.pop(type_name.name):
+        dt.declare('none')
       return dt.create()
   if isinstance(type_name, ArrayTypeName):
-    key_sort = IntSort()
+    key_sort = IntSort() if not options.bitvector else BitVecSort(256)
     value_sort = sort_for_type_name(type_name.base_type)
     return ArraySort(key_sort, value_sort)
   raise ValueError(type_name)
 
-def constraint_for_type_name(value, type_name):
+def constraint_for_type_name(value, type_name, visiting=()):
+  # Bit vectors are unsigned already
+  if is_bv(value) and bit_width(type_name):
+    return BoolVal(True)
   if isinstance(type_name, ElementaryTypeName):
     if type_name.name.startswith('uint'):
       return value >= 0
@@ -51,26 +182,34 @@ def constraint_for_type_name(value, type_name):
     if type_name.name == 'string':
       return BoolVal(True)
   if isinstance(type_name, Mapping):
+    # Values read on the path get their lemma in __getitem__
+    if options.quantifier_free: return BoolVal(True)
     key_sort = sort_for_type_name(type_name.key_type)
     key = FreshConst(key_sort)
-    return ForAll(key, constraint_for_type_name(value[key], type_name.value_type))
+    constraint = constraint_for_type_name(value[key], type_name.value_type, visiting)
+    # No quantifier is needed when every value is allowed
+    if is_true(constraint): return constraint
+    return ForAll(key, constraint)
   if isinstance(type_name, UserDefinedTypeName):
     ty, canonical_name = type_name.name.split(' ')
     if ty == 'contract': return value >= 0
-    referenced = next(search(type_name))
+    referenced = search(type_name)
     if isinstance(referenced, StructDefinition):
+      # Stop at a struct that contains itself
+      if type_name.name in visiting: return BoolVal(True)
       constraints = []
       for idx, var in enumerate(referenced.members):
         member = value.sort().accessor(0, idx)(value)
-        constraint = constraint_for_type_name(member, var.type_name)
+        constraint = constraint_for_type_name(member, var.type_name, visiting + (type_name.name,))
         constraints.append(constraint)
       return And(constraints)
   if isinstance(type_name, ArrayTypeName):
-    key = FreshConst(IntSort())
-    constraint = ForAll(key, constraint_for_type_name(value[key], type_name.base_type))
+    if options.quantifier_free: return BoolVal(True)
+    key = FreshConst(value.domain())
+    constraint = ForAll(key, constraint_for_type_name(value[key], type_name.base_type, visiting))
     if type_name.length:
-      return And([key < IntVal(int(type_name.length.value)), key >= 0, constraint])
-    return And([key >= 0, constraint])
+      return And([lt(key, IntVal(int(type_name.length.value))), ge(key, IntVal(0)), constraint])
+    return And([ge(key, IntVal(0)), constraint])
   raise ValueError((value, type_name))
 
 def default_for_type_name(value, type_name):
@@ -84,11 +223,11 @@ def default_for_type_name(value, type_name):
     if type_name.name == 'string':
       return value == StringVal('')
   if isinstance(type_name, ArrayTypeName):
-    key = FreshConst(IntSort())
+    key = FreshConst(value.domain())
     constraint = ForAll(key, default_for_type_name(value[key], type_name.base_type))
     if type_name.length:
-      return And([key < IntVal(int(type_name.length.value)), key >= 0, constraint])
-    return And([key >= 0, constraint])
+      return And([lt(key, IntVal(int(type_name.length.value))), ge(key, IntVal(0)), constraint])
+    return And([ge(key, IntVal(0)), constraint])
   raise ValueError((value, type_name))
 
 @dataclass
@@ -116,25 +255,25 @@ class VariableRef:
 
   def __lt__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val < other.val
+    val = lt(self.val, other.val)
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
   def __le__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val <= other.val
+    val = le(self.val, other.val)
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
   def __gt__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val > other.val
+    val = gt(self.val, other.val)
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
   def __ge__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val >= other.val
+    val = ge(self.val, other.val)
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
@@ -158,13 +297,15 @@ class VariableRef:
 
   def __eq__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val == other.val
+    left, right = align(self.val, other.val)
+    val = left == right
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
   def __ne__(self, other):
     type_name = ElementaryTypeName('bool')
-    val = self.val != other.val
+    left, right = align(self.val, other.val)
+    val = left != right
     constraint = And([self.constraint, other.constraint])
     return VariableRef(type_name, val, constraint)
 
@@ -176,9 +317,11 @@ class VariableRef:
 
   def __add__(self, other):
     type_name = self.type_name
-    val = self.val + other.val
+    left, right = align(self.val, other.val)
+    val = left + right
     constraint = And([
       constraint_for_type_name(val, type_name),
+      *no_overflow('+', left, right),
       self.constraint,
       other.constraint
     ])
@@ -186,9 +329,11 @@ class VariableRef:
 
   def __mul__(self, other):
     type_name = self.type_name
-    val = self.val * other.val
+    left, right = align(self.val, other.val)
+    val = left * right
     constraint = And([
       constraint_for_type_name(val, type_name),
+      *no_overflow('*', left, right),
       self.constraint,
       other.constraint
     ])
@@ -196,9 +341,11 @@ class VariableRef:
 
   def __truediv__(self, other):
     type_name = self.type_name
-    val = self.val / other.val
+    left, right = align(self.val, other.val)
+    val = UDiv(left, right) if is_bv(left) else left / right
     constraint = And([
       constraint_for_type_name(val, type_name),
+      *no_overflow('/', left, right),
       self.constraint,
       other.constraint
     ])
@@ -206,9 +353,11 @@ class VariableRef:
 
   def __mod__(self, other):
     type_name = self.type_name
-    val = self.val % other.val
+    left, right = align(self.val, other.val)
+    val = URem(left, right) if is_bv(left) else left % right
     constraint = And([
       constraint_for_type_name(val, type_name),
+      *no_overflow('%', left, right),
       self.constraint,
       other.constraint
     ])
@@ -216,9 +365,11 @@ class VariableRef:
 
   def __sub__(self, other):
     type_name = self.type_name
-    val = self.val - other.val
+    left, right = align(self.val, other.val)
+    val = left - right
     constraint = And([
       constraint_for_type_name(val, type_name),
+      *no_overflow('-', left, right),
       self.constraint,
       other.constraint
     ])
@@ -227,14 +378,16 @@ class VariableRef:
   def __lshift__(self, other):
     if isinstance(self.top, Identifier):
       name = self.top.name
-      state.store_const(name, other)
+      state.store_const(name, convert(other, self.type_name))
     else:
       left, prop = self.top
       if isinstance(left.type_name, ArrayTypeName):
         type_name = left.type_name
-        val = Store(left.val, prop.val, other.val)
+        index = cast(prop.val, left.val.domain())
+        val = Store(left.val, index, cast(other.val, left.val.range()))
         constraint = And([
           constraint_for_type_name(val, type_name),
+          *store_lemmas(val, index, type_name.base_type),
           prop.constraint,
           other.constraint
         ])
@@ -242,9 +395,11 @@ class VariableRef:
         left << right
       elif isinstance(left.type_name, Mapping):
         type_name = left.type_name
-        val = Store(left.val, prop.val, other.val)
+        index = cast(prop.val, left.val.domain())
+        val = Store(left.val, index, cast(other.val, left.val.range()))
         constraint = And([
           constraint_for_type_name(val, type_name),
+          *store_lemmas(val, index, type_name.value_type),
           prop.constraint,
           other.constraint
         ])
@@ -256,7 +411,7 @@ class VariableRef:
   def __getitem__(self, item):
     if isinstance(self.type_name, Mapping):
       type_name = self.type_name.value_type
-      val = self.val[item.val]
+      val = self.val[cast(item.val, self.val.domain())]
       constraint = And([
         constraint_for_type_name(val, type_name),
         self.constraint,
@@ -265,7 +420,7 @@ class VariableRef:
       return VariableRef(type_name, val, constraint)
     if isinstance(self.type_name, ArrayTypeName):
       type_name = self.type_name.base_type
-      val = self.val[item.val]
+      val = self.val[cast(item.val, self.val.domain())]
       constraint = And([
         constraint_for_type_name(val, type_name),
         self.constraint,
@@ -284,14 +439,14 @@ class VariableRef:
       # Return the length of array
       # TODO: load length constraint
       type_name = ElementaryTypeName('uint')
-      val = FreshConst(IntSort())
+      val = FreshConst(sort_for_type_name(type_name))
       constraint = constraint_for_type_name(val, type_name)
       if self.type_name.length:
         constraint = And([constraint, val == int(self.type_name.length.value)])
       return VariableRef(type_name, val, constraint)
 
     # Then search for defined properties
-    referenced = next(search(self.type_name))
+    referenced = search(self.type_name)
 
     if isinstance(referenced, StructDefinition):
       for idx, var in enumerate(referenced.members):
@@ -316,19 +471,100 @@ class VariableRef:
 
     raise ValueError(key)
 
+class VariableMap:
+  # Persistent map of the variables in scope. Layers shared between copies
+  # are frozen cons cells (layer, parent) and writes only go to the own top
+  # layer, so copying a state does not copy its variables
+  __slots__ = ('layer', 'parent', 'depth')
+  # Frozen layers are merged into one once there are this many
+  max_depth = 16
+
+  def __init__(self, items=(), parent=None, depth=0):
+    self.layer = dict(items)
+    self.parent = parent
+    self.depth = depth
+
+  def freeze(self):
+    if self.layer:
+      if self.depth >= self.max_depth:
+        self.parent, self.depth = (self.flatten(), None), 1
+      else:
+        self.parent, self.depth = (self.layer, self.parent), self.depth + 1
+      self.layer = {}
+    return self.parent
+
+  def __copy__(self):
+    return VariableMap((), self.freeze(), self.depth)
+
+  def get(self, name, default=None):
+    if name in self.layer:
+      return self.layer[name]
+    node = self.parent
+    while node:
+      layer, node = node
+      if name in layer:
+        return layer[name]
+    return default
+
+  def __getitem__(self, name):
+    var = self.get(name, self)
+    if var is self:
+      raise KeyError(name)
+    return var
+
+  def __setitem__(self, name, var):
+    self.layer[name] = var
+
+  def __contains__(self, name):
+    return self.get(name, self) is not self
+
+  def flatten(self):
+    layers, node = [self.layer], self.parent
+    while node:
+      layer, node = node
+      layers.append(layer)
+    merged = {}
+    for layer in reversed(layers):
+      merged.update(layer)
+    return merged
+
+  def items(self):
+    return self.flatten().items()
+
+  def changes(self, other):
+    # Variables bound differently than in other. If other is a copy taken
+    # from this map only the layers written since then are looked at
+    layers, node = [self.layer], self.parent
+    while node is not None and node is not other.parent:
+      layer, node = node
+      layers.append(layer)
+    if other.layer or node is not other.parent:
+      layers = [self.flatten()]
+    written = {}
+    for layer in reversed(layers):
+      written.update(layer)
+    return [(name, var) for name, var in written.items() if other.get(name) is not var]
+
 @dataclass
 class StateRef:
-  variables: dict
+  variables: VariableMap
   conditions: Optional[VariableRef] = None
   runtime_reverts: Optional[VariableRef] = None
   arith_check: bool = True
+  solver: Any = None
+  # Executed statements as cons cells (statement, changed variables)
+  trace: Any = None
 
   def __copy__(self):
-    _variables = dict(self.variables.items())
+    _variables = copy(self.variables)
     _conditions = self.conditions
     _runtime_reverts = self.runtime_reverts
     _arith_check = self.arith_check
-    return StateRef(_variables, _conditions, _runtime_reverts, _arith_check)
+    # The solver follows the explored path, copies share it and forks
+    # are scoped with push/pop
+    _solver = self.solver
+    _trace = self.trace
+    return StateRef(_variables, _conditions, _runtime_reverts, _arith_check, _solver, _trace)
 
   def mk_const(self, name, type_name):
     sort = sort_for_type_name(type_name)
@@ -353,12 +589,13 @@ class StateRef:
 
   def add_condition(self, condition):
     self.conditions = self.conditions & condition
+    self.solver.add(condition.constraint, condition.val)
 
   def add_runtime_revert(self, revert):
     self.runtime_reverts = self.runtime_reverts | (self.conditions & revert)
 
   def init(self):
-    self.variables = {}
+    self.variables = VariableMap()
     self.conditions = VariableRef(
       ElementaryTypeName('bool'),
       BoolVal(True),
@@ -369,9 +606,19 @@ class StateRef:
       BoolVal(False),
       BoolVal(True)
     )
-    self.arith_check = True
+    self.arith_check = not options.wrapping
+    self.solver = Solver()
+    self.trace = None
 
-state = StateRef({})
+  def record(self, statement, variables):
+    # Variables written by the statement, temporaries are left out
+    changed = []
+    for name, var in self.variables.changes(variables):
+      if '!' not in name and isinstance(var, VariableRef):
+        changed.append((name, var))
+    self.trace = ((statement, changed), self.trace)
+
+state = StateRef(VariableMap())
 
 def visit_assignment(exp):
   right = visit_expression(exp.right_hand_side)
@@ -480,14 +727,14 @@ def visit_literal(exp):
     else:
       int_val = int(exp.value)
     type_name = ElementaryTypeName('uint')
-    value = IntVal(int_val)
+    value = BitVecVal(int_val, 256) if options.bitvector else IntVal(int_val)
     return VariableRef(type_name, value)
   raise ValueError(exp.kind)
 
 def visit_function_call(exp):
   func = visit_expression(exp.expression)
   if func.is_library:
-    return func.val([exp.expression.expression] + exp.arguments)
+    return func.val([exp.expression.expression] + list(exp.arguments))
   return func.val(exp.arguments)
 
 def visit_index_access(exp):
@@ -564,11 +811,10 @@ def visit_statement(statement, returns=None):
   if isinstance(statement, ExpressionStatement):
     visit_expression(statement.expression)
   elif isinstance(statement, VariableDeclarationStatement):
-    declarations = [x.name for x in statement.declarations]
     if statement.initial_value:
       init = visit_expression(statement.initial_value)
-      for name, val in zip(declarations, init if isinstance(init, list) else [init]):
-        state.store_const(name, val)
+      for var, val in zip(statement.declarations, init if isinstance(init, list) else [init]):
+        state.store_const(var.name, convert(val, var.type_name))
     else:
       for var in statement.declarations:
         state.mk_default_const(var.name, var.type_name)
@@ -576,16 +822,316 @@ def visit_statement(statement, returns=None):
     if statement.expression:
       init = visit_expression(statement.expression)
       for r, val in zip(returns, init if isinstance(init, list) else [init]):
-        state.store_const(r.name, val)
+        state.store_const(r.name, convert(val, r.type_name))
   elif isinstance(statement, EmitStatement):
     pass
   else:
     condition = visit_expression(statement)
     state.add_condition(condition)
 
+console = ConsoleWriter()
+
+def report(result):
+  # Collected while verifying a function, printed otherwise
+  if results is not None:
+    results.append(result)
+  else:
+    console.write(result)
+
+# Tactics tried in order once the default solver gives up
+retry_ladder = [
+  ('simplify', 'propagate-values', 'solve-eqs', 'smt'),
+  ('simplify', 'nla2bv', 'smt'),
+  ('simplify', 'qfnra-nlsat'),
+]
+
+def query_timeout():
+  # The query timeout, capped by what is left of the function budget
+  timeout = options.query_timeout
+  if deadline is not None:
+    left = int((deadline - perf_counter()) * 1000)
+    timeout = min(timeout, left) if timeout else left
+  return timeout
+
+def query_rlimit():
+  # Same for the resource limit, z3 counts it from the start of a check
+  rlimit = options.query_rlimit
+  if budget is not None:
+    rlimit = min(rlimit, budget) if rlimit else budget
+  return rlimit
+
+class BudgetExceeded(Exception):
+  # The function has used up its time or resources, see validate_function
+  pass
+
+def check_budget():
+  if deadline is not None and perf_counter() >= deadline:
+    raise BudgetExceeded(f'function_timeout={options.function_timeout}')
+  if budget is not None and budget <= 0:
+    raise BudgetExceeded(f'function_rlimit={options.function_rlimit}')
+
+def flatten_conjuncts(formulas):
+  # Operators nest And([self.constraint, other.constraint]), the solver
+  # only needs every distinct conjunct once
+  conjuncts, seen = [], set()
+  stack = list(reversed(formulas))
+  while stack:
+    item = stack.pop()
+    if is_and(item):
+      stack += reversed(item.children())
+    elif not is_true(item) and item.get_id() not in seen:
+      seen.add(item.get_id())
+      conjuncts.append(item)
+  return conjuncts
+
+def free_constants(formula):
+  found, seen = set(), set()
+  stack = [formula]
+  while stack:
+    item = stack.pop()
+    if item.get_id() in seen: continue
+    seen.add(item.get_id())
+    if is_const(item) and item.decl().kind() == Z3_OP_UNINTERPRETED:
+      found.add(item.get_id())
+    else:
+      stack += item.children()
+  return found
+
+def slice_query(assertions, goal):
+  # Conjuncts are kept if they are connected to the goal through shared
+  # constants. Dropping the others keeps an unsat answer valid, a sat
+  # answer only holds for the whole path if they are satisfiable too
+  conjuncts = flatten_conjuncts(list(assertions) + list(goal))
+  constants = [free_constants(x) for x in conjuncts]
+  users = {}
+  for idx, names in enumerate(constants):
+    for name in names:
+      users.setdefault(name, []).append(idx)
+  # Ground conjuncts, e.g. False after revert(), are always kept
+  keep = set([idx for idx, names in enumerate(constants) if not names])
+  stack = list(set().union(*[free_constants(x) for x in flatten_conjuncts(goal)]))
+  visited = set(stack)
+  while stack:
+    for idx in users.get(stack.pop(), []):
+      if idx in keep: continue
+      keep.add(idx)
+      for name in constants[idx]:
+        if name not in visited:
+          visited.add(name)
+          stack.append(name)
+  return [x for idx, x in enumerate(conjuncts) if idx in keep]
+
+def solve(solver, model=False, goal=None, confirm=False):
+  # goal holds the assertions that were added last, the query is sliced
+  # around them. With confirm a sat answer is checked on the whole path,
+  # require and assume conditions are never checked on their own.
+  # Conjuncts are only flattened and deduplicated for a sliced query, the
+  # path solver is incremental and rebuilding it per check costs more
+  query = solver
+  if options.slice_queries and goal is not None:
+    query = Solver()
+    query.add(slice_query(solver.assertions(), goal))
+  outcome, answered = memoize(query, model)
+  if (model or confirm) and outcome == sat and query is not solver:
+    # Sliced away constants need values that fit the whole path
+    outcome, answered = decide(solver)
+  return outcome, answered
+
+def memoize(solver, model=False):
+  # Decided queries are memoized. Only a sat query that needs a model has
+  # to be solved again, the model is kept by the solver
+  if queries is None:
+    return decide(solver)
+  key = query_key(And(solver.assertions()))
+  cached = queries.get(key)
+  if cached == 'unsat' or (cached == 'sat' and not model):
+    return (sat if cached == 'sat' else unsat), solver
+  outcome, answered = decide(solver)
+  if outcome != unknown:
+    queries.put(key, str(outcome))
+  return outcome, answered
+
+def phase(name):
+  return profiler.phase(name) if profiler else nullcontext()
+
+def formula_stats(formulas):
+  # Number of distinct subterms and how many of them are quantifiers
+  seen, quantifiers = set(), 0
+  stack = list(formulas)
+  while stack:
+    item = stack.pop()
+    if item.get_id() in seen: continue
+    seen.add(item.get_id())
+    if is_quantifier(item): quantifiers += 1
+    stack += item.children()
+  return len(seen), quantifiers
+
+def decide(solver):
+  if not profiler:
+    return spend(solver)
+  with phase('solve'):
+    start = perf_counter()
+    outcome, answered = spend(solver)
+    elapsed = perf_counter() - start
+  # Kept apart, so the overhead of profiling does not blur other phases
+  with phase('measure'):
+    size, quantifiers = formula_stats(solver.assertions())
+    stats = answered.statistics()
+    statistics = dict([(x, stats.get_key_value(x)) for x in stats.keys()])
+  profiler.query('.'.join(context), str(outcome), elapsed, size, quantifiers, statistics)
+  return outcome, answered
+
+def resource_count(solver):
+  # Resources z3 has used so far, counted for the whole context
+  return solver.statistics().get_key_value('rlimit count')
+
+def spend(solver):
+  # Queries are charged to the budget of the function, an unknown that
+  # comes from running out of it stops the function
+  global budget
+  check_budget()
+  if budget is None:
+    outcome, answered = attempt(solver)
+  else:
+    count = resource_count(solver)
+    try:
+      outcome, answered = attempt(solver)
+    finally:
+      budget -= resource_count(solver) - count
+  if outcome == unknown:
+    check_budget()
+  return outcome, answered
+
+def attempt(solver):
+  # Returns the outcome and the solver holding the model
+  timeout = query_timeout()
+  if timeout is not None:
+    if timeout <= 0: return unknown, solver
+    solver.set('timeout', timeout)
+  rlimit = query_rlimit()
+  if rlimit is not None:
+    solver.set('rlimit', rlimit)
+  outcome = solver.check()
+  if outcome != unknown or not options.retry:
+    return outcome, solver
+  for tactics in retry_ladder:
+    timeout = query_timeout()
+    if timeout is not None and timeout <= 0: break
+    retry = Then(*tactics).solver()
+    if timeout is not None: retry.set('timeout', timeout)
+    if rlimit is not None: retry.set('rlimit', rlimit)
+    retry.add(solver.assertions())
+    try:
+      outcome = retry.check()
+    except Z3Exception:
+      # Tactics fail on goals outside of their logic
+      continue
+    if outcome != unknown:
+      return outcome, retry
+  return unknown, solver
+
+def concrete_value(model, val, type_name):
+  val = model.eval(val, model_completion=True)
+  if isinstance(type_name, (Mapping, ArrayTypeName)):
+    if isinstance(type_name, Mapping):
+      key_type, value_type = type_name.key_type, type_name.value_type
+    else:
+      key_type, value_type = ElementaryTypeName('uint'), type_name.base_type
+    if is_as_array(val):
+      entries = model[get_as_array_func(val)].as_list()
+      default = concrete_value(model, entries.pop(), value_type)
+      entries = [(concrete_value(model, k, key_type), concrete_value(model, v, value_type)) for k, v in entries]
+      return {'entries': dict([(str(k), v) for k, v in entries]), 'default': default}
+    # Models of arrays are stores on top of a constant array
+    entries = {}
+    while is_store(val):
+      key = concrete_value(model, val.arg(1), key_type)
+      entries.setdefault(str(key), concrete_value(model, val.arg(2), value_type))
+      val = val.arg(0)
+    if is_const_array(val):
+      default = concrete_value(model, val.arg(0), value_type)
+      return {'entries': entries, 'default': default}
+    return str(val)
+  if isinstance(type_name, UserDefinedTypeName):
+    ty, canonical_name = type_name.name.split(' ')
+    referenced = search(type_name) if ty == 'struct' else None
+    if isinstance(referenced, StructDefinition):
+      if val.decl().name() != 'data': return None
+      members = [(x.name, concrete_value(model, val.arg(idx), x.type_name)) for idx, x in enumerate(referenced.members)]
+      return dict(members)
+  if is_int_value(val) or is_bv_value(val):
+    return val.as_long()
+  if is_true(val) or is_false(val):
+    return is_true(val)
+  if is_string_value(val):
+    return val.as_string()
+  return str(val)
+
+def canonical_model(solver):
+  # The model z3 finds depends on every term its context has seen, which
+  # differs with the number of workers. The query is solved again in a
+  # fresh context with its constants renamed in order of appearance, terms
+  # of the path are mapped into it by the returned function
+  assertions = list(solver.assertions())
+  renamed, seen, stack = [], set(), assertions[::-1]
+  while stack:
+    item = stack.pop()
+    if item.get_id() in seen: continue
+    seen.add(item.get_id())
+    if is_const(item) and item.decl().kind() == Z3_OP_UNINTERPRETED:
+      renamed.append((item, Const(f'model!{len(renamed)}', item.sort())))
+    else:
+      stack += item.children()[::-1]
+  ctx = Context()
+  def translate(val):
+    return (substitute(val, *renamed) if renamed else val).translate(ctx)
+  fresh = Solver(ctx=ctx)
+  timeout = query_timeout()
+  if timeout is not None: fresh.set('timeout', max(timeout, 1))
+  fresh.add([translate(x) for x in assertions])
+  if fresh.check() != sat: return None
+  return fresh.model(), translate
+
+def counterexample(solver):
+  # Inputs of the function under their solidity names, then the path
+  # replayed with concrete values
+  model, translate = canonical_model(solver) or (solver.model(), lambda x: x)
+  values = dict([(name, concrete_value(model, translate(x.val), x.type_name)) for name, x in inputs.items()])
+  steps = []
+  trace = state.trace
+  while trace:
+    (statement, changed), trace = trace
+    assigned = dict([(name, concrete_value(model, translate(x.val), x.type_name)) for name, x in changed])
+    steps.append({'statement': repr(statement), 'values': assigned})
+  return values, steps[::-1]
+
+def check_result(kind, expression, outcome, expected, elapsed, model=None, trace=None):
+  # The checked solidity expression is kept as written, printing the z3
+  # term would cost more than most queries and shows fresh names
+  if outcome == expected:
+    status = 'proved'
+  elif outcome == unknown:
+    status = 'unknown'
+  else:
+    status = 'falsified'
+  contract, function = context
+  return Result(contract, function, path_id, kind, repr(expression), status, elapsed, model, trace)
+
+def term_size(expr, limit):
+  # Number of distinct subterms, counting stops at limit
+  seen = set()
+  stack = [expr]
+  while stack and len(seen) < limit:
+    item = stack.pop()
+    if item.get_id() not in seen:
+      seen.add(item.get_id())
+      stack += item.children()
+  return len(seen)
+
 # solidity ensures functions
 def sol_ensures(arguments):
   pre, post = arguments
+  written = BinaryOperation(pre, post, '=>')
   names = list(islice(gn.names(), 2))
   # Add to before all
   stmt = VariableDeclarationStatement([
@@ -623,7 +1169,8 @@ def sol_ensures(arguments):
           Identifier(names[0]),
           Identifier(names[1]),
           '=>'
-        )
+        ),
+        written
       ]
     )
   )
@@ -633,25 +1180,29 @@ def sol_ensures(arguments):
 # solidity ok functions
 def sol_ok(arguments):
   arg = visit_expression(arguments[0])
-  assertion = And([state.conditions.constraint, state.conditions.val, arg.constraint, arg.val])
-  solver = Solver()
-  solver.add(assertion)
-  if solver.check() == sat:
-    print(colored(f'    ok({arg.val})', 'green'))
-  else:
-    print(colored(f'    ok({arg.val})', 'yellow'))
+  solver = state.solver
+  solver.push()
+  solver.add(arg.constraint, arg.val)
+  start = perf_counter()
+  outcome, _ = solve(solver, goal=[arg.constraint, arg.val], confirm=True)
+  elapsed = perf_counter() - start
+  solver.pop()
+  report(check_result('ok', arguments[0], outcome, sat, elapsed))
 
 # solidity assert functions
 def sol_assert(arguments):
   arg = visit_expression(arguments[0])
-  pre = And([state.conditions.constraint, state.conditions.val, arg.constraint])
-  assertion = Implies(pre, arg.val)
-  solver = Solver()
-  solver.add(Not(assertion))
-  if solver.check() == unsat:
-    print(colored(f'    assert({arg.val})', 'green'))
-  else:
-    print(colored(f'    assert({arg.val})', 'yellow'))
+  # Path condition is already asserted in the solver
+  solver = state.solver
+  solver.push()
+  solver.add(arg.constraint, Not(arg.val))
+  start = perf_counter()
+  outcome, answered = solve(solver, True, [arg.constraint, Not(arg.val)])
+  elapsed = perf_counter() - start
+  model, trace = counterexample(answered) if outcome == sat else (None, None)
+  solver.pop()
+  # Generated asserts pass the expression they stand for as well
+  report(check_result('assert', arguments[-1], outcome, unsat, elapsed, model, trace))
 
 # solidity require function
 def sol_require(arguments):
@@ -672,6 +1223,17 @@ def sol_sum(arguments):
   name = arguments[0].name
   return visit_expression(Identifier(f'sum_{name}'))
 
+# solidity revert(), the rest of the path is unreachable
+def sol_revert(arguments):
+  state.add_condition(VariableRef(ElementaryTypeName('bool'), BoolVal(False)))
+
+# solidity havoc, used by loop summaries to forget modified variables
+def sol_havoc(arguments):
+  for arg in arguments:
+    for name in [arg.name, f'sum_{arg.name}']:
+      if name in state.variables:
+        state.mk_const(name, state.fetch_const(name).type_name)
+
 # solidity reverts_if()
 def sol_reverts_if(arguments):
   # TODO: handle reverts if
@@ -681,8 +1243,9 @@ def sol_reverts_if(arguments):
 # ICounter ic = ICounter(0x0000)
 def solc_interface(name, arguments):
   var = visit_expression(arguments[0])
-  var.type_name = UserDefinedTypeName(f'contract {name}')
-  return var
+  # A new reference, the variable itself keeps its type on other paths and
+  # in the other functions sharing the prologue
+  return replace(var, type_name=UserDefinedTypeName(f'contract {name}'))
 
 # solidity interface function
 def solc_interface_function(function, arguments):
@@ -697,32 +1260,8 @@ def solc_interface_function(function, arguments):
   return visit_expression(TupleExpression(returns))
 
 def sol_func(function, arguments):
-  global state, before_all, after_all
-  # If it is a private funciton -> try to prove
-  if function.visibility in ['private', 'internal']:
-    _state, _before_all, _after_all = copy(state), before_all[::], after_all[::]
-    # Try to prove before using specification
-    for param, arg in zip(function.parameters, arguments):
-      statement = VariableDeclarationStatement([
-        VariableDeclaration(param.name, param.type_name)
-      ], Anything(param.type_name))
-      visit_statement(statement)
-    for var in function.returns:
-      state.mk_default_const(var.name, var.type_name)
-    # Backup here
-    before_all, after_all = [], []
-    for path in compute_execution_paths(function.body):
-      __state = copy(state)
-      for statement in path:
-        visit_statement(statement, function.returns)
-        while before_all:
-          visit_statement(before_all.pop(0), function.returns)
-      while after_all:
-        visit_statement(after_all.pop(0), function.returns)
-      state = __state
-    # Reset state
-    state, before_all, after_all = _state, _before_all, _after_all
-
+  # Callees are verified once as functions of their own (see
+  # is_verified_function), callers only instantiate their ensures summary
   # Load specifications
   before, mid, after = [], [], []
   returns = []
@@ -735,7 +1274,7 @@ def sol_func(function, arguments):
       ], Anything(x.type_name))
     )
     returns.append(Identifier(name))
-  for var, value in zip(function.parameters + function.returns, arguments + returns):
+  for var, value in zip(function.parameters + function.returns, list(arguments) + returns):
     name = next(gn.names())
     before.append(
       VariableDeclarationStatement([
@@ -808,69 +1347,352 @@ def sol_func(function, arguments):
     visit_statement(x)
   return visit_expression(TupleExpression(returns))
 
-def validate(root):
-  global search
-
-  # validate
-  for contracts, libraries, variables, functions, func, path in generate_execution_paths(root):
-    state.init()
-    search = partial(type_search, root, libraries)
-    # visible contracts
-    for name in contracts:
-      state.store_const(
-        name,
-        FunctionRef(False, partial(solc_interface, name))
-      )
-    # visible functions
-    for function in functions:
-      state.store_const(
-        function.name,
-        FunctionRef(False, partial(sol_func, function))
-      )
-    # State functions
-    state.store_const('ok', FunctionRef(False, partial(sol_ok)))
-    state.store_const('assert', FunctionRef(False, partial(sol_assert)))
-    state.store_const('require', FunctionRef(False, partial(sol_require)))
-    state.store_const('ensures', FunctionRef(False, partial(sol_ensures)))
-    state.store_const('address', FunctionRef(False, partial(sol_address)))
-    state.store_const('assume', FunctionRef(False, partial(sol_assume)))
-    state.store_const('reverts_if', FunctionRef(False, partial(sol_reverts_if)))
-    # Block
-    Block = UserDefinedTypeName('struct Block')
-    block = VariableDeclaration('block', Block)
-    state.mk_const(block.name, block.type_name)
-    # Msg
-    Msg = UserDefinedTypeName('struct Msg')
-    msg = VariableDeclaration('msg', Msg)
-    state.mk_const(msg.name, msg.type_name)
-    #
-    state.mk_const('this', ElementaryTypeName('address'))
-    # Balances
-    balances = VariableDeclaration(
-      '@B',
-      Mapping(
-        ElementaryTypeName('address'),
-        ElementaryTypeName('uint')
+class SymbolicExplorer(PathExplorer):
+  # Runs the symbolic execution along the explored tree, so a branch is
+  # only entered if its condition is satisfiable under the path condition
+  def __init__(self, returns):
+    self.returns = returns
+    self.truncated = set()
+
+  def step(self, statement):
+    with phase('execute'):
+      variables = copy(state.variables)
+      visit_statement(statement, self.returns)
+      while before_all:
+        visit_statement(before_all.pop(0), self.returns)
+      state.record(statement, variables)
+
+  def branch(self, condition):
+    # Once max_paths paths are done no other branch is entered
+    if options.max_paths is not None and path_id >= options.max_paths:
+      self.truncate(f'max_paths={options.max_paths}')
+      return False
+    with phase('branch'):
+      count = len(state.solver.assertions()) if options.slice_queries else 0
+      self.step(condition)
+      goal = state.solver.assertions()[count:] if options.slice_queries else None
+      # Branches that can not be decided in time are explored
+      return solve(state.solver, goal=goal)[0] != unsat
+
+  def save(self):
+    state.solver.push()
+    return copy(state), before_all[::], after_all[::]
+
+  def restore(self, snapshot):
+    global state, before_all, after_all
+    state, before_all, after_all = snapshot
+    state.solver.pop()
+
+  def cutoff(self, statement):
+    self.truncate(f'max_depth={options.max_depth}')
+
+  def truncate(self, bound):
+    # Paths left out are not verified, which is reported once per function
+    if bound not in self.truncated:
+      self.truncated.add(bound)
+      report(Result(*context, path_id, 'bound', bound, 'unknown', 0.0))
+
+  def merge(self, statement):
+    global results
+    if not options.merge_paths: return False
+    # Paths ending inside a branch can not be joined again
+    if has_terminal_statement(statement): return False
+    # Reports of a failed attempt are dropped, the if is forked instead
+    outer, results = results, []
+    try:
+      merged = self.join(statement)
+    finally:
+      collected, results = results, outer
+    if merged:
+      for result in collected:
+        report(result)
+    return merged
+
+  def run(self, statement):
+    # Straight line execution of a branch, nested ifs are merged too
+    if isinstance(statement, Block):
+      for x in statement.statements:
+        if not self.run(x): return False
+      return True
+    if isinstance(statement, IfStatement):
+      return self.merge(statement)
+    self.step(statement)
+    return True
+
+  def join(self, statement):
+    global state, before_all, after_all
+    base = copy(state), before_all[::], after_all[::]
+    condition = visit_expression(statement.condition)
+    branches = []
+    for taken, body in [(condition, statement.true_body), (condition.__not__(), statement.false_body)]:
+      state, before_all, after_all = copy(base[0]), base[1][::], base[2][::]
+      # Collect the conditions added by this branch only
+      state.conditions = VariableRef(ElementaryTypeName('bool'), BoolVal(True), BoolVal(True))
+      state.solver.push()
+      state.add_condition(taken)
+      if solve(state.solver, goal=[taken.constraint, taken.val])[0] == unsat:
+        state.solver.pop()
+        continue
+      completed = self.run(body) if body else True
+      state.solver.pop()
+      if not completed or after_all != base[2]:
+        state, before_all, after_all = base
+        return False
+      branches.append(state)
+    state, before_all, after_all = base
+    if not branches:
+      state.add_condition(VariableRef(ElementaryTypeName('bool'), BoolVal(False)))
+      return True
+    if len(branches) == 1:
+      delta = branches[0].conditions
+      variables = branches[0].variables
+    else:
+      left, right = branches
+      delta = VariableRef(
+        ElementaryTypeName('bool'),
+        Or(And(left.conditions.constraint, left.conditions.val),
+           And(right.conditions.constraint, right.conditions.val)),
+        BoolVal(True)
       )
+      variables = VariableMap()
+      for name, var in left.variables.items():
+        if name not in right.variables: continue
+        other = right.variables[name]
+        if var is other:
+          variables[name] = var
+          continue
+        if not isinstance(var, VariableRef) or not isinstance(other, VariableRef):
+          return False
+        val = If(condition.val, var.val, other.val)
+        if term_size(val, options.merge_limit) >= options.merge_limit:
+          return False
+        constraint = If(condition.val, var.constraint, other.constraint)
+        variables[name] = VariableRef(var.type_name, val, constraint)
+    state = copy(state)
+    state.variables, variables = variables, state.variables
+    state.record(statement, variables)
+    state.add_condition(delta)
+    return True
+
+def prepare_contract(contracts, functions, variables):
+  # visible contracts
+  for name in contracts:
+    state.store_const(
+      name,
+      FunctionRef(False, partial(solc_interface, name))
     )
-    state.mk_const(balances.name, balances.type_name)
-    # Create a variable for sum
-    for var in variables:
-      if isinstance(var.type_name, Mapping):
-        type_name = var.type_name
-        if isinstance(type_name.value_type, ElementaryTypeName):
-          state.mk_const(f'sum_{var.name}', type_name.value_type)
-          state.store_const(f'sum_uint', FunctionRef(False, partial(sol_sum)))
-    # Global variables and parameters
-    for var in variables + func.parameters:
-      state.mk_const(var.name, var.type_name)
-    # Returns
-    for var in func.returns:
-      state.mk_default_const(var.name, var.type_name)
-    # Start validating every execution paths
-    for statement in path:
-      visit_statement(statement, func.returns)
-      while before_all:
-        visit_statement(before_all.pop(0), func.returns)
-    while after_all:
-      visit_statement(after_all.pop(0), func.returns)
+  # visible functions
+  for function in functions:
+    state.store_const(
+      function.name,
+      FunctionRef(False, partial(sol_func, function))
+    )
+  # State functions
+  state.store_const('ok', FunctionRef(False, partial(sol_ok)))
+  state.store_const('assert', FunctionRef(False, partial(sol_assert)))
+  state.store_const('require', FunctionRef(False, partial(sol_require)))
+  state.store_const('ensures', FunctionRef(False, partial(sol_ensures)))
+  state.store_const('address', FunctionRef(False, partial(sol_address)))
+  state.store_const('assume', FunctionRef(False, partial(sol_assume)))
+  state.store_const('reverts_if', FunctionRef(False, partial(sol_reverts_if)))
+  state.store_const('revert', FunctionRef(False, partial(sol_revert)))
+  state.store_const('havoc', FunctionRef(False, partial(sol_havoc)))
+  # Block
+  Block = UserDefinedTypeName('struct Block')
+  block = VariableDeclaration('block', Block)
+  state.mk_const(block.name, block.type_name)
+  # Msg
+  Msg = UserDefinedTypeName('struct Msg')
+  msg = VariableDeclaration('msg', Msg)
+  state.mk_const(msg.name, msg.type_name)
+  #
+  state.mk_const('this', ElementaryTypeName('address'))
+  # Balances
+  balances = VariableDeclaration(
+    '@B',
+    Mapping(
+      ElementaryTypeName('address'),
+      ElementaryTypeName('uint')
+    )
+  )
+  state.mk_const(balances.name, balances.type_name)
+  # Create a variable for sum
+  for var in variables:
+    if isinstance(var.type_name, Mapping):
+      type_name = var.type_name
+      if isinstance(type_name.value_type, ElementaryTypeName):
+        state.mk_const(f'sum_{var.name}', type_name.value_type)
+        state.store_const(f'sum_uint', FunctionRef(False, partial(sol_sum)))
+  # Global variables
+  for var in variables:
+    state.mk_const(var.name, var.type_name)
+
+def prepare_function(table, contract, contracts, libraries, variables, functions, func):
+  global search, before_all, after_all, inputs
+
+  state.init()
+  before_all, after_all = [], []
+  search = partial(type_search, table, bind_libraries(table, libraries))
+  # The contract part is built once and shared by all of its functions,
+  # each starts on a copy of it with its own solver. It is built again
+  # only if the members it refers to changed
+  key = tuple(contracts), tuple(functions), tuple(variables)
+  if contract in prologues and prologues[contract][0] == key:
+    # Later comparisons of this run are then by identity
+    prologues[contract] = key, prologues[contract][1]
+  else:
+    prepare_contract(contracts, functions, variables)
+    prologues[contract] = key, copy(state.variables)
+  state.variables = copy(prologues[contract][1])
+  # Parameters
+  for var in func.parameters:
+    state.mk_const(var.name, var.type_name)
+  # Initial values are mapped back to these names in counterexamples
+  names = ['msg', 'block', 'this', '@B'] + [x.name for x in variables + list(func.parameters)]
+  inputs = dict([(x, state.fetch_const(x)) for x in names])
+  # Returns
+  for var in func.returns:
+    state.mk_default_const(var.name, var.type_name)
+  return SymbolicExplorer(func.returns)
+
+def validate_function(table, contract, contracts, libraries, variables, functions, func):
+  global context, path_id, deadline, budget
+  context = contract, func.name
+  path_id = 0
+  begin = perf_counter()
+  deadline = begin + options.function_timeout if options.function_timeout else None
+  budget = options.function_rlimit
+  with phase('prepare'):
+    explorer = prepare_function(table, contract, contracts, libraries, variables, functions, func)
+  with phase('paths'):
+    start = perf_counter()
+    try:
+      for path in compute_execution_paths(func.body, explorer, options):
+        # Reverted paths do not have to satisfy post conditions
+        if not (path and is_revert_statement(path[-1])):
+          # Explorer has already visited the path, finish it with post conditions
+          with phase('execute'):
+            while after_all:
+              visit_statement(after_all.pop(0), func.returns)
+        if profiler:
+          profiler.path(f'{contract}.{func.name}', path_id, perf_counter() - start)
+        path_id += 1
+        # Results of the path are handed out before the next one is explored
+        yield
+        start = perf_counter()
+    except BudgetExceeded as e:
+      # The rest of the function is left unexplored, one result stands for it
+      report(Result(*context, path_id, 'timeout', str(e), 'unknown', perf_counter() - begin))
+
+# Every worker process has its own copy of the verifier globals
+worker_table = None
+worker_contracts = None
+# Options and structs the sorts were made for
+worker_sorts = None
+
+def init_worker(root, _options, _queries=None, _profile=False):
+  global worker_table, worker_contracts, worker_sorts, options, queries, profiler
+  options = _options
+  queries = _queries
+  profiler = Profiler() if _profile else None
+  with phase('setup'):
+    worker_table = build_symbol_table(root)
+    # Sorts and prologues stay warm between runs on an edited tree, as in
+    # watch mode, unless the options or a struct changed
+    generation = astuple(options), tuple([x for x in walk_nodes(root) if isinstance(x, StructDefinition)])
+    if generation != worker_sorts:
+      worker_sorts = generation
+      sorts.clear()
+      prologues.clear()
+    worker_contracts = dict([(x[0].name, x[1:]) for x in generate_contracts(root)])
+
+def stream_worker(task):
+  # Yields the results of a function path by path
+  global results
+  name, idx = task
+  contracts, libraries, variables, functions = worker_contracts[name]
+  results = []
+  try:
+    with phase(f'{name}.{functions[idx].name}'):
+      for _ in validate_function(worker_table, name, contracts, libraries, variables, functions, functions[idx]):
+        collected, results = results, []
+        yield from collected
+    yield from results
+  finally:
+    results = None
+
+def worker_stats():
+  return queries.collect() if queries else None, profiler.collect() if profiler else None
+
+def run_worker(task):
+  return (list(stream_worker(task)), *worker_stats())
+
+def reproducible(results, options):
+  # Only unknown outcomes under a time limit depend on the load of the
+  # machine, those functions are not cached and verified again next time.
+  # Bounds, resource limits and undecided queries give the same results,
+  # the options are part of the cache key
+  if options.query_timeout is None and options.function_timeout is None:
+    return True
+  return not [x for x in results if x.status == 'unknown' and x.kind != 'bound']
+
+def verify(root, jobs=1, cache=None, options=None, queries=None, profile=None):
+  # Yields the result records of every function in report order
+  options = options or Options()
+  timer = profile.phase('plan') if profile else nullcontext()
+  with timer:
+    table = build_symbol_table(root)
+    plan = []
+    for contract, contracts, libraries, variables, functions in generate_contracts(root):
+      units = []
+      for idx, func in enumerate(functions):
+        if is_verified_function(func) and idx in contracts[contract.name].verified:
+          key, cached = None, None
+          if cache:
+            key = function_digest(table, contract, libraries, variables, functions, func, options)
+            cached = cache.load(key)
+          units.append((idx, key, cached))
+      plan.append((contract.name, units))
+  # Only functions missing from the cache are verified
+  tasks = [(name, idx) for name, units in plan for idx, key, cached in units if cached is None]
+  pool = None
+  if jobs > 1:
+    pool = Pool(jobs, init_worker, (root, options, queries, bool(profile)))
+    # imap yields in submission order, so the report order is deterministic
+    outputs = pool.imap(run_worker, tasks)
+  else:
+    init_worker(root, options, queries, bool(profile))
+    setup = profiler.collect() if profiler else None
+    if setup: profile.absorb(setup)
+  try:
+    for name, units in plan:
+      for idx, key, cached in units:
+        if cached is None:
+          if pool:
+            cached, stats, measured = next(outputs)
+          else:
+            # In process the results are yielded as soon as a path is done
+            cached = []
+            for result in stream_worker((name, idx)):
+              cached.append(result)
+              yield result
+            stats, measured = worker_stats()
+          if stats: queries.absorb(stats)
+          if measured: profile.absorb(measured)
+          if cache and reproducible(cached, options):
+            cache.store(key, cached)
+          if not pool: continue
+        yield from cached
+  finally:
+    if pool: pool.terminate()
+
+def validate(root, jobs=1, cache=None, options=None, writers=None, queries=None, profile=None):
+  writers = [ConsoleWriter()] if writers is None else writers
+  collected = []
+  for result in verify(root, jobs, cache, options, queries, profile):
+    for writer in writers:
+      writer.write(result)
+    collected.append(result)
+  for writer in writers:
+    writer.close()
+  return collected